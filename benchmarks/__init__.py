@@ -0,0 +1 @@
+""" Benchmarks of the HisenseTV integration against simulated TVs. """
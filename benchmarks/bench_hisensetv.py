@@ -0,0 +1,196 @@
+""" Latency and throughput benchmark of the HisenseTV integration.
+
+Drives HisenseTvMediaPlayer and HisenseTvSwitch entities against simulated
+TVs and reports command latency, poll cost and the MQTT connections and
+requests each operation costs. Run from the repository root:
+
+    python -m benchmarks.bench_hisensetv --tvs 4 --iterations 50
+
+Each simulated TV listens on its own loopback address (127.0.0.10 and up)
+on the real MQTT port, so the integration connects exactly as it would to
+a TV on the network.
+"""
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.hisensetv import async_setup
+from custom_components.hisensetv.const import DOMAIN, DOMAIN_DATA
+from custom_components.hisensetv.media_player import HisenseTvMediaPlayer
+from custom_components.hisensetv.switch import HisenseTvSwitch
+
+from .simulator import SimulatedHisenseTv
+
+_LOGGER = logging.getLogger(__name__)
+
+FIRST_HOST = 10
+# time for requests still in flight to reach the TVs before counting them;
+# QoS 0 publishes return before the packet is on the wire
+SETTLE_SEC = 0.1
+VOLUME_BURST = 20
+
+
+def percentile(samples: list, percent: float) -> float:
+    """Return the nearest-rank percentile of samples."""
+    ordered = sorted(samples)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+class Result:
+    """Latencies, errors and TV-side counters of one benchmarked operation."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.connections = 0
+        self.requests = 0
+
+    def row(self) -> str:
+        ops = len(self.latencies) + self.errors
+        if not self.latencies:
+            return f"{self.name:<24}{ops:>6}{'-':>10}{'-':>10}{self.errors:>8}"
+        return (
+            f"{self.name:<24}{ops:>6}"
+            f"{percentile(self.latencies, 50) * 1000:>10.1f}"
+            f"{percentile(self.latencies, 99) * 1000:>10.1f}"
+            f"{self.errors:>8}"
+            f"{self.connections / ops:>10.2f}"
+            f"{self.requests / ops:>10.2f}"
+        )
+
+
+class BenchTv:
+    """A simulated TV with the coordinator and entities bound to it."""
+
+    def __init__(self, hass, index: int, args):
+        self.host = f"127.0.0.{FIRST_HOST + index}"
+        self.sim = SimulatedHisenseTv(self.host, latency=args.latency / 1000, drop_rate=args.drop_rate)
+        self.coordinator = hass.data[DOMAIN_DATA].get_coordinator(hass, self.host, args.scan_interval, 1)
+        self.player = HisenseTvMediaPlayer(
+            coordinator=self.coordinator,
+            mac="00:00:00:00:00:%02x" % index,
+            model="bench",
+            name=f"bench_{index}",
+            broadcast_address=None,
+            pause_resume="ok",
+        )
+        self.switch = HisenseTvSwitch(
+            coordinator=self.coordinator,
+            mac="00:00:00:00:00:%02x" % index,
+            model="bench",
+            name=f"bench_{index}",
+            broadcast_address=None,
+        )
+        # the simulated TV powers on when it receives a magic packet
+        wake = lambda: hass.loop.call_soon_threadsafe(hass.async_create_task, self.sim.async_power_on())
+        for platform, entity in (("media_player", self.player), ("switch", self.switch)):
+            entity.hass = hass
+            entity.entity_id = f"{platform}.bench_{index}"
+            entity._send_magic_packet = wake
+
+    async def async_added(self):
+        await self.player.async_added_to_hass()
+        await self.switch.async_added_to_hass()
+
+    async def async_volume_burst(self):
+        """Send a burst of volume steps and wait until the TV has the last one."""
+        for step in range(VOLUME_BURST):
+            await self.player.async_set_volume_level((step + 1) / 100)
+        while self.coordinator._volume_task is not None:
+            await asyncio.sleep(0.001)
+
+
+async def async_measure(result: Result, tvs: list, iterations: int, operation):
+    """Run operation(tv) iterations times per TV, all TVs concurrently."""
+    await asyncio.sleep(SETTLE_SEC + tvs[0].sim.latency)
+    for tv in tvs:
+        tv.sim.reset_counters()
+
+    async def run(tv):
+        for _ in range(iterations):
+            start = time.perf_counter()
+            try:
+                await operation(tv)
+            except Exception as e:
+                _LOGGER.debug("%s failed on %s: %s", result.name, tv.host, e)
+                result.errors += 1
+            else:
+                result.latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(run(tv) for tv in tvs))
+    await asyncio.sleep(SETTLE_SEC + tvs[0].sim.latency)
+    result.connections = sum(tv.sim.connections for tv in tvs)
+    result.requests = sum(sum(tv.sim.requests.values()) for tv in tvs)
+    return result
+
+
+async def async_cold_poll(tv):
+    tv.coordinator.connection.close()
+    await tv.coordinator.async_refresh()
+
+
+async def async_power_cycle(tv):
+    await tv.switch.async_turn_off()
+    while tv.sim.is_on:
+        await asyncio.sleep(0.001)
+    await tv.switch.async_turn_on()
+
+
+async def async_main(args):
+    hass = HomeAssistant()
+    # as hass.async_run() does; without it async_stop() stops the loop
+    # under asyncio.run() before the benchmark returns
+    hass._stopped = asyncio.Event()
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass.config.config_dir = config_dir
+        await hass.async_start()
+        await async_setup(hass, {DOMAIN: {}})
+        tvs = [BenchTv(hass, index, args) for index in range(args.tvs)]
+        for tv in tvs:
+            await tv.sim.async_power_on()
+            await tv.async_added()
+
+        n = args.iterations
+        results = [
+            await async_measure(Result("poll (cold session)"), tvs, n, async_cold_poll),
+            await async_measure(Result("poll (warm session)"), tvs, n, lambda tv: tv.coordinator.async_refresh()),
+            await async_measure(Result("switch update"), tvs, n, lambda tv: tv.switch.async_update()),
+            await async_measure(Result("send_command"), tvs, n, lambda tv: tv.player.async_send_command("up")),
+            await async_measure(Result("select_source"), tvs, n, lambda tv: tv.player.async_select_source("HDMI 1")),
+            await async_measure(Result("refresh_sources"), tvs, n, lambda tv: tv.player.async_refresh_sources()),
+            await async_measure(Result(f"volume burst x{VOLUME_BURST}"), tvs, n, BenchTv.async_volume_burst),
+            await async_measure(Result("power off/on"), tvs, args.power_cycles, async_power_cycle),
+        ]
+
+        print(f"{args.tvs} TV(s), {args.latency:g} ms latency, {args.drop_rate:.0%} drop rate")
+        print(f"{'operation':<24}{'ops':>6}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'conn/op':>10}{'req/op':>10}")
+        for result in results:
+            print(result.row())
+
+        for tv in tvs:
+            await tv.sim.async_power_off()
+        await hass.async_stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tvs", type=int, default=4, help="number of simulated TVs")
+    parser.add_argument("--iterations", type=int, default=50, help="operations per TV and scenario")
+    parser.add_argument("--power-cycles", type=int, default=2, help="power off/on cycles per TV")
+    parser.add_argument("--latency", type=float, default=5, help="TV response latency in milliseconds")
+    parser.add_argument("--drop-rate", type=float, default=0, help="fraction of requests the TV ignores")
+    parser.add_argument("--scan-interval", type=float, default=60, help="scan_interval of the entities")
+    parser.add_argument("--debug", action="store_true", help="enable debug logging")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    asyncio.run(async_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+""" Simulated Hisense Television for benchmarks.
+
+A minimal MQTT 3.1.1 broker over TLS that answers the topics used by
+hisensetv.HisenseTv for keys, volume, sources and TV state, and sends the
+same broadcasts a real TV does. Only what the library needs is
+implemented: QoS 0 publishes, subscriptions with '+' and '#' wildcards
+and keep-alive pings.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import ssl
+import struct
+
+_LOGGER = logging.getLogger(__name__)
+
+CERTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator.pem")
+
+MQTT_CONNECT = 1
+MQTT_PUBLISH = 3
+MQTT_PUBACK = 4
+MQTT_SUBSCRIBE = 8
+MQTT_UNSUBSCRIBE = 10
+MQTT_PINGREQ = 12
+MQTT_DISCONNECT = 14
+
+BROADCAST_BASE = "/remoteapp/mobile/broadcast"
+
+DEFAULT_SOURCES = ("TV", "HDMI 1", "HDMI 2", "HDMI 3", "HDMI 4", "AV")
+
+
+def _topic_matches(topic_filter: str, topic: str) -> bool:
+    """Return true if topic matches an MQTT topic filter."""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _encode_length(length: int) -> bytes:
+    """Encode an MQTT remaining length."""
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(header: int, body: bytes = b"") -> bytes:
+    return bytes([header]) + _encode_length(len(body)) + body
+
+
+def _publish_packet(topic: str, payload: bytes) -> bytes:
+    encoded = topic.encode("utf-8")
+    return _packet(MQTT_PUBLISH << 4, struct.pack("!H", len(encoded)) + encoded + payload)
+
+
+class _Client:
+    """One MQTT client session on the simulated broker."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.task = asyncio.current_task()
+        self.subscriptions = set()
+
+    def send(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+
+class SimulatedHisenseTv:
+    """A Hisense TV answering on host:port, by default the real MQTT port.
+
+    latency is the delay in seconds before the TV acts on a request, and
+    drop_rate the probability that it silently ignores one. Counters of
+    connections, requests and keys received are kept for reporting.
+    """
+
+    def __init__(self, host: str, port: int = 36669, *, latency: float = 0.0, drop_rate: float = 0.0,
+                 sources=DEFAULT_SOURCES, volume: int = 20):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.sources = [
+            {"displayname": name, "sourceid": str(index), "sourcename": name, "is_signal": "1"}
+            for index, name in enumerate(sources, 1)
+        ]
+        self.source = self.sources[0]
+        self.volume = volume
+        self.is_on = False
+        self.connections = 0
+        self.requests = {}
+        self.keys = []
+        self._clients = set()
+        self._server = None
+        self._ssl = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self._ssl.load_cert_chain(CERTFILE)
+
+    async def async_power_on(self):
+        """Start the MQTT broker, as the TV does when it wakes."""
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle_client, self.host, self.port, ssl=self._ssl)
+        self.is_on = True
+
+    async def async_power_off(self):
+        """Broadcast sleep, then stop the broker and drop every session."""
+        self.is_on = False
+        self._broadcast("ui_service/state", {"statetype": "fake_sleep_0"})
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        clients = list(self._clients)
+        for client in clients:
+            client.writer.close()
+        await asyncio.gather(*(client.task for client in clients), return_exceptions=True)
+
+    def reset_counters(self):
+        """Zero the connection and request counters."""
+        self.connections = 0
+        self.requests = {}
+        self.keys = []
+
+    def _broadcast(self, subtopic: str, payload: dict):
+        self._publish(f"{BROADCAST_BASE}/{subtopic}", payload)
+
+    def _publish(self, topic: str, payload):
+        data = _publish_packet(topic, json.dumps(payload).encode("utf-8"))
+        for client in list(self._clients):
+            if any(_topic_matches(topic_filter, topic) for topic_filter in client.subscriptions):
+                client.send(data)
+
+    async def _handle_client(self, reader, writer):
+        client = _Client(writer)
+        self._clients.add(client)
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                if not self._handle_packet(client, header[0], body):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+    def _handle_packet(self, client, header: int, body: bytes) -> bool:
+        """Answer one packet; return false to end the session."""
+        packet_type = header >> 4
+        if packet_type == MQTT_CONNECT:
+            client.send(_packet(0x20, b"\x00\x00"))
+        elif packet_type == MQTT_SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, b""
+            while offset < len(body):
+                (size,) = struct.unpack_from("!H", body, offset)
+                client.subscriptions.add(body[offset + 2:offset + 2 + size].decode("utf-8"))
+                offset += size + 3
+                granted += b"\x00"
+            client.send(_packet(0x90, packet_id + granted))
+        elif packet_type == MQTT_UNSUBSCRIBE:
+            client.send(_packet(0xB0, body[:2]))
+        elif packet_type == MQTT_PUBLISH:
+            (size,) = struct.unpack_from("!H", body)
+            topic = body[2:2 + size].decode("utf-8")
+            offset = 2 + size
+            if (header >> 1) & 0x03:
+                client.send(_packet(MQTT_PUBACK << 4, body[offset:offset + 2]))
+                offset += 2
+            self._handle_request(client, topic, body[offset:])
+        elif packet_type == MQTT_PINGREQ:
+            client.send(_packet(0xD0))
+        elif packet_type == MQTT_DISCONNECT:
+            return False
+        return True
+
+    def _handle_request(self, client, topic: str, payload: bytes):
+        # /remoteapp/tv/<service>/<client topic>/actions/<action>
+        levels = topic.split("/")
+        if len(levels) != 7 or levels[2] != "tv" or levels[5] != "actions":
+            return
+        service, client_topic, action = levels[3], levels[4], levels[6]
+        self.requests[action] = self.requests.get(action, 0) + 1
+        if random.random() < self.drop_rate:
+            _LOGGER.debug("%s dropping %s", self.host, action)
+            return
+        response_topic = f"/remoteapp/mobile/{client_topic}/{service}/data/{action}"
+        asyncio.get_event_loop().call_later(
+            self.latency, self._respond, client, action, response_topic, payload.decode("utf-8")
+        )
+
+    def _respond(self, client, action: str, response_topic: str, payload: str):
+        """Act on a request after the simulated latency."""
+        if action == "sendkey":
+            self.keys.append(payload)
+            if payload == "KEY_POWER":
+                asyncio.ensure_future(self.async_power_off())
+            elif payload in ("KEY_VOLUMEUP", "KEY_VOLUMEDOWN"):
+                self._set_volume(self.volume + (1 if payload == "KEY_VOLUMEUP" else -1))
+        elif action == "getvolume":
+            client.send(_publish_packet(response_topic, json.dumps(
+                {"volume_type": 0, "volume_value": self.volume}).encode("utf-8")))
+        elif action == "changevolume":
+            self._set_volume(int(payload))
+        elif action == "sourcelist":
+            client.send(_publish_packet(response_topic, json.dumps(self.sources).encode("utf-8")))
+        elif action == "changesource":
+            sourceid = json.loads(payload).get("sourceid")
+            for source in self.sources:
+                if source["sourceid"] == sourceid:
+                    self.source = source
+                    self._broadcast("ui_service/state", {
+                        "statetype": "sourceswitch",
+                        "sourceid": source["sourceid"],
+                        "sourcename": source["sourcename"],
+                        "displayname": source["displayname"],
+                    })
+        elif action == "gettvstate":
+            client.send(_publish_packet(response_topic, json.dumps({
+                "statetype": "sourceswitch",
+                "sourceid": self.source["sourceid"],
+                "sourcename": self.source["sourcename"],
+                "displayname": self.source["displayname"],
+            }).encode("utf-8")))
+
+    def _set_volume(self, volume: int):
+        self.volume = max(0, min(100, volume))
+        self._broadcast("platform_service/actions/volumechange", {"volume_type": 0, "volume_value": self.volume})
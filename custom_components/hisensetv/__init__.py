@@ -1,44 +1,60 @@
 """ Hisense Television Integration. """
-from hisensetv import HisenseTv
+from datetime import timedelta
 
+from homeassistant.core import callback
 from homeassistant.helpers import discovery
-import homeassistant.helpers.config_validation as cv
 
 from homeassistant.helpers.entity import ToggleEntity
 from homeassistant.helpers.entity_component import EntityComponent
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.restore_state import RestoreEntity
 from homeassistant.helpers.typing import ConfigType, HomeAssistantType
 from homeassistant.loader import bind_hass
 
+import asyncio
+import functools
 import logging
-import platform
-import subprocess as sp
-import socket
 import time
-import voluptuous as vol
-import wakeonlan
-import sys
 
 from homeassistant.const import (
+    ATTR_COMMAND,
+    ATTR_ENTITY_ID,
     CONF_BROADCAST_ADDRESS,
     CONF_HOST, 
     CONF_MAC,
     CONF_NAME,
+    EVENT_HOMEASSISTANT_STOP,
     STATE_OFF,
     STATE_ON,
 )
 
 from . import const
+from .breaker import tv_errors
+from .connection import HisenseTvConnectionPool
+from .coordinator import HisenseTvCoordinator
+from .discovery import HisenseTvResolver
+from .source_cache import HisenseTvSourceCache
 from .const import (
+    ATTR_COMMANDS,
+    ATTR_DELAY,
+    ATTR_REPEAT,
+    COMMAND_KEYS,
+    COMMANDS_URGENT,
+    CONNECTION_EVICT_INTERVAL_SEC,
+    CONNECTION_IDLE_TIMEOUT_SEC,
     CONF_MODEL,
     DATA_TV_STATUS,
     DEFAULT_PING_TIMEOUT,
     DEFAULT_MODEL,
+    DEFAULT_OFF_AFTER_MISSES,
     DEFAULT_NAME,
+    DIAGNOSTICS_WRITE_INTERVAL_SEC,
     DOMAIN,
     DOMAIN_DATA,
+    EVENT_SEND_COMMANDS_RESULT,
     ICON_TV,
-    PING_RESPONSE_WAIT_SEC,
+    PRIORITY_NORMAL,
+    PRIORITY_URGENT,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -49,141 +65,268 @@ _LOGGER = logging.getLogger(__name__)
 class HisenseData:
     """Init Data Class."""
 
-    def __init__(self):
+    def __init__(self, hass):
         """Init Class."""
-        self.devices = []
+        # entity_id -> entity, for the service handlers
+        self.devices = {}
+        self.connections = HisenseTvConnectionPool()
+        self.coordinators = {}
+        self.source_cache = HisenseTvSourceCache(hass)
+        self.resolver = HisenseTvResolver(hass)
+
+    def get_coordinator(
+        self, hass, host: str, scan_interval: float, probe_timeout: float,
+        off_after_misses: int = DEFAULT_OFF_AFTER_MISSES, mac: str = None, broadcast_address: str = None,
+    ) -> HisenseTvCoordinator:
+        """Return the coordinator shared by all entities of the TV at host."""
+        coordinator = self.coordinators.get(host)
+        if coordinator is None:
+            coordinator = self.coordinators[host] = HisenseTvCoordinator(
+                hass, host, self.connections.get(host), self.source_cache, scan_interval, probe_timeout,
+                off_after_misses,
+            )
+            coordinator.rediscover = functools.partial(self.async_rediscover, coordinator)
+            coordinator.async_start()
+        else:
+            coordinator.configure(scan_interval, probe_timeout, off_after_misses)
+        if coordinator.mac is None:
+            coordinator.mac = mac
+            coordinator.broadcast_address = broadcast_address
+        return coordinator
+
+    async def async_rediscover(self, coordinator: HisenseTvCoordinator) -> bool:
+        """Move coordinator to the address its TV now has; return true if it moved."""
+        old_host = coordinator.host
+        host = await self.resolver.async_resolve(
+            coordinator.mac, coordinator.broadcast_address or old_host, exclude=old_host
+        )
+        if coordinator.host != old_host:
+            # moved by a lookup that finished first
+            return True
+        if host is None:
+            return False
+        if host in self.coordinators:
+            _LOGGER.warning(
+                "HisenseTV %s found at %s, which is configured for another TV", coordinator.mac, host
+            )
+            return False
+        _LOGGER.warning("HisenseTV %s moved from %s to %s", coordinator.mac, old_host, host)
+        self.coordinators[host] = self.coordinators.pop(old_host)
+        await coordinator.async_rebind(host, self.connections.get(host))
+        for entry in coordinator.hass.config_entries.async_entries(DOMAIN):
+            if entry.data.get(CONF_HOST) == old_host:
+                coordinator.hass.config_entries.async_update_entry(entry, data={**entry.data, CONF_HOST: host})
+        return True
+
+    @callback
+    def async_release(self, coordinator: HisenseTvCoordinator):
+        """Stop coordinator once no entity is bound to it."""
+        if coordinator.has_listeners:
+            return
+        coordinator.async_shutdown()
+        # the coordinator is kept under the address it polls, which may
+        # differ from the one its config entry now holds
+        if self.coordinators.get(coordinator.host) is coordinator:
+            del self.coordinators[coordinator.host]
 
 
 async def async_setup(hass: HomeAssistantType, base_config: ConfigType) -> bool:
 #def setup(hass: HomeAssistantType, base_config: ConfigType) -> bool:
     """Set up a hisense tv."""
-    hass.data[DOMAIN_DATA] = HisenseData()
+    data = hass.data[DOMAIN_DATA] = HisenseData(hass)
+    await data.source_cache.async_load()
 #    component = hass.data[DOMAIN] = EntityComponent(_LOGGER, DOMAIN, hass, SCAN_INTERVAL)
 #    await component.async_setup(base_config)
+
+    async def async_evict_idle(now):
+        """Close sessions to TVs that have not been used recently."""
+        await hass.async_add_executor_job(
+            data.connections.evict_idle, CONNECTION_IDLE_TIMEOUT_SEC
+        )
+
+    async def async_close_connections(event):
+        """Stop polling and close all sessions on shutdown."""
+        for coordinator in data.coordinators.values():
+            coordinator.async_shutdown()
+        await hass.async_add_executor_job(data.connections.close_all)
+
+    async_track_time_interval(
+        hass, async_evict_idle, timedelta(seconds=CONNECTION_EVICT_INTERVAL_SEC)
+    )
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close_connections)
     _LOGGER.info("Setting up %s", DOMAIN)
     return True
 
 
+async def async_setup_entry(hass: HomeAssistantType, entry) -> bool:
+    """Set up a TV added through the config flow, as a media_player."""
+    hass.async_create_task(hass.config_entries.async_forward_entry_setup(entry, "media_player"))
+    return True
+
+
+async def async_unload_entry(hass: HomeAssistantType, entry) -> bool:
+    """Remove the media_player of a TV, which stops polling it if nothing else uses it."""
+    return await hass.config_entries.async_forward_entry_unload(entry, "media_player")
+
+
 #class HisenseTvDevice(Entity):
-class HisenseTvDevice(ToggleEntity):
+class HisenseTvDevice(ToggleEntity, RestoreEntity):
     """Representation of a generic HiSense TV entity."""
 
-    def __init__(self, host: str, mac: str, model: str, name: str, broadcast_address: str, scan_interval: int):
+    def __init__(
+        self, coordinator: HisenseTvCoordinator, mac: str, model: str, name: str, broadcast_address: str,
+        unique_id: str = None,
+    ):
         self._name = name
-        self._host = host
+        self._unique_id = unique_id
+        self._coordinator = coordinator
         self._mac = mac
         self._model = model
         self._broadcast_address = broadcast_address
         self._icon = ICON_TV
-        self._state = STATE_OFF
-        self._scan_interval = scan_interval
-        self._updatets = time.monotonic()
+        self._remove_listener = None
+        self._written = None
+        self._written_diagnostics = None
+        self._written_at = 0.0
+        self.suppressed_writes = 0
+
+    @property
+    def coordinator(self) -> HisenseTvCoordinator:
+        """Return the coordinator of the TV."""
+        return self._coordinator
+
+    async def _async_call_tv(self, func, priority: int = PRIORITY_NORMAL):
+        """Run func(tv) on the shared session, through the command queue."""
+        return await self._coordinator.async_call(func, priority=priority)
+
+    def _send_magic_packet(self):
+        """Send the Wake-on-LAN packet."""
+        import wakeonlan
 
-    def turn_on(self, **kwargs):
-        self._state = STATE_ON
         if self._broadcast_address:
             wakeonlan.send_magic_packet(
                self._mac, ip_address=self._broadcast_address
             )
         else:
             wakeonlan.send_magic_packet(self._mac)
-        # the sleep is needed to allow for ping response time
-        time.sleep(PING_RESPONSE_WAIT_SEC)
-        self.schedule_update_ha_state()
 
-    def turn_off(self, **kwargs):
-        try:
-            self._state = STATE_OFF
-            _LOGGER.debug("Sending Power Off to HisenseTV at %s", self._host)
-            with HisenseTv(self._host) as tv:
-               tv.send_key_power()
-            time.sleep(PING_RESPONSE_WAIT_SEC)
-            self.schedule_update_ha_state()
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            raise
-
-    def update(self):
-        """ Retrieve the latest data, but only after interval."""
-        # Only update every update_interval
-        if (time.monotonic() - self._updatets) >= self._scan_interval:
-           #_LOGGER.debug("Updating...")
-           self._updatets = time.monotonic()
-           self._update()
-        else:
-           _LOGGER.debug("Skipping update...")
+    async def async_turn_on(self, **kwargs):
+        # returns once the TV accepts a session, so following commands go through
+        await self._coordinator.async_wake(self._send_magic_packet)
+
+    async def async_turn_off(self, **kwargs) -> bool:
+        _LOGGER.debug("Sending Power Off to HisenseTV at %s", self._coordinator.host)
+        # an unreachable TV is already off, so the state is not rolled back
+        self._coordinator.async_set_optimistic("state", STATE_OFF)
+        return await self.async_send_command("power")
+
+    @property
+    def should_poll(self) -> bool:
+        """Polling is scheduled by the coordinator, which pushes state changes."""
+        return False
+
+    async def async_update(self):
+        """ Retrieve the latest data, shared with the other entities of this TV."""
+        await self._coordinator.async_refresh()
 
     async def async_added_to_hass(self):
-        """Maintain list of devices."""
-        self.hass.data[DOMAIN_DATA].devices.append(self)
+        """Maintain index of devices, and show the last state until the first poll."""
+        await super().async_added_to_hass()
+        self.hass.data[DOMAIN_DATA].devices[self.entity_id] = self
+        self._remove_listener = self._coordinator.async_add_listener(self._async_coordinator_updated)
+        last_state = await self.async_get_last_state()
+        if last_state is not None:
+            self._async_restore(last_state)
+
+    @callback
+    def _async_restore(self, last_state):
+        """Seed the coordinator from the last recorded state."""
+        self._coordinator.async_restore(state=last_state.state)
+
+    @callback
+    def _async_coordinator_updated(self):
+        """Write the state if it differs from the one last written.
+
+        Diagnostics change with every poll, so on their own they are
+        written at most every DIAGNOSTICS_WRITE_INTERVAL_SEC.
+        """
+        written = (self.available, self.state, self.state_attributes)
+        diagnostics = self._coordinator.diagnostics
+        now = time.monotonic()
+        if written == self._written and (
+            diagnostics == self._written_diagnostics or now - self._written_at < DIAGNOSTICS_WRITE_INTERVAL_SEC
+        ):
+            self.suppressed_writes += 1
+            return
+        self._written = written
+        self._written_diagnostics = diagnostics
+        self._written_at = now
+        self.async_write_ha_state()
 
     async def async_will_remove_from_hass(self):
-        """Remove Entity from Hass."""
-        self.hass.data[DOMAIN_DATA].devices.remove(self)
+        """Remove Entity from Hass, and stop its coordinator if no other entity uses it."""
+        self.hass.data[DOMAIN_DATA].devices.pop(self.entity_id, None)
+        if self._remove_listener is not None:
+            self._remove_listener()
+            self._remove_listener = None
+        self.hass.data[DOMAIN_DATA].async_release(self._coordinator)
 
-    def send_command(self, command_value: str):
-        """Send command to TV."""
+    async def async_send_command(self, command_value: str) -> bool:
+        """Send command to TV; return false if it was not sent."""
+        priority = PRIORITY_URGENT if command_value in COMMANDS_URGENT else PRIORITY_NORMAL
+        return bool(await self._async_call_tv(lambda tv: self._send_command(tv, command_value), priority))
+
+    def _send_command(self, tv, command_value: str) -> bool:
+        """Send command over an open session."""
+        _LOGGER.debug("send_command - Command='%s'", command_value)
+        key = COMMAND_KEYS.get(command_value)
+        if key is None:
+           _LOGGER.error("Invalid HisenseTV send_command input parmater: %s", command_value)
+           return False
+        tv.send_key(key)
+        return True
+
+    async def async_send_commands(self, steps: list):
+        """Send a sequence of commands over the shared session.
+
+        Each press is a call of its own on the command queue, so presses
+        are spaced like any other call and an urgent command can cut in;
+        delays are waited out on the event loop. The number of presses
+        sent for each step is reported in an event.
+        """
+        presses = []
+        for index, step in enumerate(steps):
+            presses.extend([(index, step[ATTR_COMMAND], step[ATTR_DELAY])] * step[ATTR_REPEAT])
+        sent = [0] * len(steps)
+
+        error = None
         try:
-            with HisenseTv(self._host) as tv:
-               _LOGGER.debug("send_command - Command='%s'", command_value)
-               if command_value == 'power':
-                  if not tv.send_key_power():
-                     _LOGGER.error("ERROR - send_key - Command 'power' failure.")
-               elif command_value == 'up':
-                  if not tv.send_key_up():
-                     _LOGGER.error("ERROR - send_key - Command 'up' failure.")
-               elif command_value == 'down':
-                  if not tv.send_key_down():
-                     _LOGGER.error("ERROR - send_key - Command 'down' failure.")
-               elif command_value == 'left':
-                  if not tv.send_key_left():
-                     _LOGGER.error("ERROR - send_key - Command 'left' failure.")
-               elif command_value == 'right':
-                  if not tv.send_key_right():
-                     _LOGGER.error("ERROR - send_key - Command 'right' failure.")
-               elif command_value == 'menu':
-                  if not tv.send_key_menu():
-                     _LOGGER.error("ERROR - send_key - Command 'menu' failure.")
-               elif command_value == 'back':
-                  if not tv.send_key_back():
-                     _LOGGER.error("ERROR - send_key - Command 'back' failure.")
-               elif command_value == 'exit':
-                  if not tv.send_key_exit():
-                     _LOGGER.error("ERROR - send_key - Command 'exit' failure.")
-               elif command_value == 'ok':
-                  if not tv.send_key_ok():
-                     _LOGGER.error("ERROR - send_key - Command 'ok' failure.")
-               elif command_value == 'volume_up':
-                  if not tv.send_key_volume_up():
-                     _LOGGER.error("ERROR - send_key - Command 'volume up' failure.")
-               elif command_value == 'volume_down':
-                  if not tv.send_key_volume_down():
-                     _LOGGER.error("ERROR - send_key - Command 'volume down' failure.")
-               elif command_value == 'forwards':
-                  if not tv.send_key_forwards():
-                     _LOGGER.error("ERROR - send_key - Command 'forwards' failure.")
-               elif command_value == 'backs':
-                  if not tv.send_key_backs():
-                     _LOGGER.error("ERROR - send_key - Command 'backs' failure.")
-               elif command_value == 'stop':
-                  if not tv.send_key_stop():
-                     _LOGGER.error("ERROR - send_key - Command 'stop' failure.")
-               elif command_value == 'play':
-                  if not tv.send_key_play():
-                     _LOGGER.error("ERROR - send_key - Command 'play' failure.")
-               elif command_value == 'pause':
-                  if not tv.send_key_pause():
-                     _LOGGER.error("ERROR - send_key - Command 'pause' failure.")
-               else:
-                  _LOGGER.error("Invalid HisenseTV send_command input parmater: %s", command_value)
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
+            for position, (index, command, delay) in enumerate(presses):
+                # the coordinator reports an unreachable TV as no result
+                if not await self._async_call_tv(lambda tv: self._send_command(tv, command)):
+                    error = "TV unreachable"
+                    break
+                sent[index] += 1
+                if delay and position + 1 < len(presses):
+                    await asyncio.sleep(delay)
+        except tv_errors() as e:
+            error = e
+        if error is not None:
+            _LOGGER.error("send_commands - aborted after %d of %d presses: %s", sum(sent), len(presses), error)
 
+        results = []
+        for index, step in enumerate(steps):
+            results.append({
+                ATTR_COMMAND: step[ATTR_COMMAND],
+                ATTR_REPEAT: step[ATTR_REPEAT],
+                "sent": sent[index],
+                "success": sent[index] == step[ATTR_REPEAT],
+            })
+            _LOGGER.debug("send_commands - Step %d '%s' sent %d/%d", index, step[ATTR_COMMAND], sent[index], step[ATTR_REPEAT])
+        self.hass.bus.async_fire(
+            EVENT_SEND_COMMANDS_RESULT, {ATTR_ENTITY_ID: self.entity_id, ATTR_COMMANDS: results}
+        )
+        return results
 
     @property
     def supported_features(self) -> int:
@@ -193,18 +336,30 @@ class HisenseTvDevice(ToggleEntity):
     @property
     def is_on(self):
         """Return true if device is on."""
-        return self._state
+        return self._coordinator.state == STATE_ON
 
     @property
     def state(self):
         """Return the state of the device."""
-        return self._state
+        return self._coordinator.state
+
+    @property
+    def device_state_attributes(self):
+        """Return latency and error statistics of the TV, for diagnostics."""
+        diagnostics = self._coordinator.diagnostics
+        diagnostics["suppressed_writes"] = self.suppressed_writes
+        return diagnostics
 
     @property
     def name(self):
         """Return the name of the switch."""
         return self._name
 
+    @property
+    def unique_id(self):
+        """Return the MAC address of TVs added through the config flow."""
+        return self._unique_id
+
     @property
     def icon(self):
         """Return the icon to be used for this entity."""
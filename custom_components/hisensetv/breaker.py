@@ -0,0 +1,121 @@
+""" Hisense Television circuit breaker for unreachable TVs. """
+import errno
+import logging
+import socket
+import threading
+import time
+
+from .const import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_OPEN_MAX_SEC,
+    BREAKER_OPEN_MIN_SEC,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+BREAKER_CLOSED = "closed"
+BREAKER_HALF_OPEN = "half_open"
+BREAKER_OPEN = "open"
+
+# socket errors meaning the TV is off, asleep or gone from the network
+UNREACHABLE_ERRNOS = {
+    errno.ECONNABORTED,
+    errno.ECONNREFUSED,
+    errno.ECONNRESET,
+    errno.EHOSTDOWN,
+    errno.EHOSTUNREACH,
+    errno.ENETDOWN,
+    errno.ENETUNREACH,
+    errno.EPIPE,
+    errno.ETIMEDOUT,
+}
+
+
+class HisenseTvUnavailableError(ConnectionError):
+    """Raised instead of connecting while the circuit to a TV is open."""
+
+
+def tv_errors() -> tuple:
+    """Return the exception types a call to the TV may raise.
+
+    For use in except clauses, which only evaluate it once an exception
+    is raised, so hisensetv is not imported before the first session.
+    """
+    from hisensetv import HisenseTvError
+
+    return (OSError, HisenseTvError)
+
+
+def is_unreachable(error: Exception) -> bool:
+    """Return true if error means the TV could not be reached."""
+    from hisensetv import HisenseTvTimeoutError
+
+    if isinstance(error, (HisenseTvUnavailableError, HisenseTvTimeoutError, socket.timeout)):
+        return True
+    return isinstance(error, OSError) and error.errno in UNREACHABLE_ERRNOS
+
+
+class HisenseTvCircuitBreaker:
+    """Closed/open/half-open circuit breaker for one TV.
+
+    After BREAKER_FAILURE_THRESHOLD consecutive unreachable errors the
+    circuit opens and calls fail fast. Once the open period ends, or a
+    cheap probe finds the TV answering, it is half-open: the next call
+    goes through and closes the circuit on success, or reopens it for
+    twice as long on failure.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self._state = BREAKER_CLOSED
+        self._failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Return the current state, moving open to half-open once expired."""
+        with self._lock:
+            if self._state == BREAKER_OPEN and time.monotonic() >= self._open_until:
+                self._state = BREAKER_HALF_OPEN
+            return self._state
+
+    @property
+    def remaining(self) -> float:
+        """Seconds until an open circuit becomes half-open."""
+        return max(0.0, self._open_until - time.monotonic())
+
+    def allow(self) -> bool:
+        """Return true if a call to the TV may be attempted."""
+        return self.state != BREAKER_OPEN
+
+    def half_open(self):
+        """Let the next call through, after a probe found the TV answering."""
+        with self._lock:
+            if self._state == BREAKER_OPEN:
+                self._state = BREAKER_HALF_OPEN
+
+    def record_success(self):
+        """Close the circuit after a successful call."""
+        with self._lock:
+            if self._state != BREAKER_CLOSED:
+                _LOGGER.info("HisenseTV at %s is reachable again", self.host)
+            self._state = BREAKER_CLOSED
+            self._failures = 0
+            self._trips = 0
+
+    def record_failure(self):
+        """Count an unreachable error, opening the circuit if needed."""
+        with self._lock:
+            self._failures += 1
+            if self._state != BREAKER_HALF_OPEN and self._failures < BREAKER_FAILURE_THRESHOLD:
+                return
+            if self._state == BREAKER_CLOSED:
+                _LOGGER.warning("HisenseTV at %s is unreachable, pausing connection attempts", self.host)
+            self._trips += 1
+            open_time = min(BREAKER_OPEN_MAX_SEC, BREAKER_OPEN_MIN_SEC * 2 ** (self._trips - 1))
+            self._open_until = time.monotonic() + open_time
+            self._state = BREAKER_OPEN
+            self._failures = 0
+            _LOGGER.debug("Circuit to %s open for %ds", self.host, open_time)
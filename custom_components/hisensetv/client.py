@@ -0,0 +1,261 @@
+""" Hisense Television MQTT client. """
+from hisensetv import HisenseTv, HisenseTvNotConnectedError, HisenseTvTimeoutError
+import paho.mqtt.client as mqtt
+
+import functools
+import json
+import logging
+import math
+import posixpath
+import queue
+import socket
+import ssl
+import threading
+import time
+
+from .const import BROADCAST_TOPIC
+from .stats import HisenseTvStats
+from .tls import shared_context
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _decode(payload: bytes):
+    """Return a JSON message payload decoded, or None if empty or invalid."""
+    try:
+        return json.loads(payload.decode("utf-8")) if payload else None
+    except ValueError:
+        return None
+
+
+def identify(hostname: str, timeout: float) -> bool:
+    """Return true if hostname accepts an MQTT session with the TV's login.
+
+    Blocking. Anything else listening on the TV's port either fails the
+    TLS handshake or refuses the login hisensetv uses.
+    """
+    defaults = HisenseTv(hostname)
+    accepted = threading.Event()
+    codes = []
+
+    def on_connect(client, userdata, flags, rc):
+        codes.append(rc)
+        accepted.set()
+
+    client = mqtt.Client(defaults.client_id)
+    client.username_pw_set(username=defaults.username, password=defaults.password)
+    client.tls_set_context(context=shared_context())
+    client.tls_insecure_set(True)
+    client.on_connect = on_connect
+    try:
+        # the keepalive is also the socket timeout of the connect
+        client.connect(hostname, defaults.port, keepalive=max(1, math.ceil(timeout)))
+    except (OSError, ValueError) as e:
+        _LOGGER.debug("%s is not a HisenseTV: %s", hostname, e)
+        return False
+    client.loop_start()
+    try:
+        accepted.wait(timeout)
+    finally:
+        client.disconnect()
+        client.loop_stop()
+    if codes != [mqtt.CONNACK_ACCEPTED]:
+        _LOGGER.debug("%s is not a HisenseTV: %s", hostname, mqtt.connack_string(codes[0]) if codes else "no reply")
+        return False
+    return True
+
+
+def _timed(operation: str, func):
+    """Wrap a HisenseTv method so every call is recorded in the session's stats."""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self._stats is None:
+            return func(self, *args, **kwargs)
+        with self._stats.measure(operation):
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+class PooledHisenseTv(HisenseTv):
+    """HisenseTv session that stays open until explicitly closed."""
+
+    def __init__(self, hostname: str, *, on_broadcast=None, stats: HisenseTvStats = None, **kwargs):
+        super().__init__(hostname, **kwargs)
+        self._on_broadcast_callback = on_broadcast
+        self._stats = stats
+        # responses collected for request(), by action
+        self._responses = {}
+        self._expected = set()
+        self._optional = set()
+        self._responses_lock = threading.Lock()
+        # set once every response but the optional ones, and once all, are in
+        self._responses_ready = threading.Event()
+        self._all_responses_ready = threading.Event()
+        # monotonic time the TV last sent anything over this session
+        self.last_received = None
+
+    # the send_key_* helpers all go through send_key
+    send_key = _timed("send_key", HisenseTv.send_key)
+    get_volume = _timed("get_volume", HisenseTv.get_volume)
+    set_volume = _timed("set_volume", HisenseTv.set_volume)
+    get_sources = _timed("get_sources", HisenseTv.get_sources)
+    set_source = _timed("set_source", HisenseTv.set_source)
+
+    def __enter__(self):
+        try:
+            self._connect()
+        except BaseException:
+            self.close()
+            raise
+        sock = self._mqtt_client.socket()
+        if isinstance(sock, ssl.SSLSocket) and self._stats is not None:
+            self._stats.record_tls(sock.session_reused)
+        try:
+            # requests are tiny, so do not let Nagle hold back the second
+            # of a burst until the TV acknowledges the first
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError) as e:
+            _LOGGER.debug("Unable to disable Nagle for %s: %s", self.hostname, e)
+        return self
+
+    def _connect(self):
+        """Connect as HisenseTv does, with the shared TLS context.
+
+        The context is built once and resumes the TLS session of the
+        previous connection to this TV, instead of a full handshake.
+        """
+        self._mqtt_client = mqtt.Client(self.client_id)
+        self._mqtt_client.username_pw_set(username=self.username, password=self.password)
+        self._mqtt_client.tls_set_context(context=shared_context())
+        self._mqtt_client.tls_insecure_set(True)
+
+        self._mqtt_client.on_connect = self._on_connect
+        self._mqtt_client.on_message = self._on_message
+        self._mqtt_client.on_disconnect = self._on_disconnect
+        if self.enable_client_logger:
+            self._mqtt_client.enable_logger()
+
+        self._mqtt_client.connect(self.hostname, self.port)
+        self._mqtt_client.loop_start()
+
+        start_time = time.monotonic()
+        while not self.connected:
+            time.sleep(0.01)
+            if time.monotonic() - start_time > self.timeout:
+                raise HisenseTvTimeoutError(f"failed to connect in {self.timeout:.3f}s")
+
+    def _call_service(self, *, service: str, action: str, payload=None):
+        """Publish a request, as HisenseTv does, without waiting forever.
+
+        paho never marks a request published once the socket is gone, so
+        the wait is bounded by the timeout, after which the session is
+        closed.
+        """
+        if service not in self._VALID_SERVICES:
+            raise ValueError(
+                f"service of {service!r} is invalid, service must be one of {self._VALID_SERVICES!r}"
+            )
+        if isinstance(payload, dict):
+            payload = json.dumps(payload)
+        full_topic = posixpath.join("/", "remoteapp", "tv", service, self._device_topic, "actions", action)
+
+        info = self._mqtt_client.publish(topic=full_topic, payload=payload)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.close()
+            raise HisenseTvNotConnectedError(f"failed to send {action}: {mqtt.error_string(info.rc)}")
+        deadline = time.monotonic() + self.timeout
+        delay = 0.0005
+        while not info.is_published():
+            if time.monotonic() > deadline:
+                self.close()
+                raise HisenseTvTimeoutError(f"failed to send {action} in {self.timeout:.3f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        """Callback upon MQTT broker connection, also subscribes to broadcasts."""
+        super()._on_connect(client, userdata, flags, rc)
+        self.last_received = time.monotonic()
+        if self._on_broadcast_callback is not None:
+            # topic callbacks take precedence over on_message, so broadcasts
+            # never end up in the response queue
+            client.message_callback_add(BROADCAST_TOPIC, self._on_broadcast)
+            client.subscribe(BROADCAST_TOPIC)
+
+    def _on_message(self, client, userdata, msg):
+        """Callback upon a response, collecting those request() waits for."""
+        self.last_received = time.monotonic()
+        action = msg.topic.rsplit("/", 1)[-1]
+        with self._responses_lock:
+            if action in self._expected:
+                self._expected.discard(action)
+                self._responses[action] = _decode(msg.payload)
+                if not self._expected - self._optional:
+                    self._responses_ready.set()
+                if not self._expected:
+                    self._all_responses_ready.set()
+                return
+        super()._on_message(client, userdata, msg)
+
+    def _on_broadcast(self, client, userdata, msg):
+        """Callback upon a state broadcast from the TV."""
+        self.last_received = time.monotonic()
+        payload = _decode(msg.payload)
+        if payload is None and msg.payload:
+            _LOGGER.debug("Ignoring broadcast on %s: %r", msg.topic, msg.payload)
+            return
+        self._on_broadcast_callback(msg.topic, payload)
+
+    def request(self, *requests, optional=(), grace: float = 0) -> dict:
+        """Send several requests back-to-back and wait for all responses.
+
+        requests are (service, action) pairs. Returns the response to each
+        action, or None for those the TV did not answer within the timeout.
+        The actions in optional are only waited for up to grace seconds
+        after the others are answered.
+        """
+        if not self.connected:
+            raise HisenseTvNotConnectedError("you must be connected to call request")
+        with self._responses_lock:
+            self._responses = {}
+            self._expected = {action for _, action in requests}
+            self._optional = set(optional)
+            self._responses_ready.clear()
+            self._all_responses_ready.clear()
+            if not self._expected - self._optional:
+                self._responses_ready.set()
+        for service, action in requests:
+            self._call_service(service=service, action=action)
+        if self._responses_ready.wait(self.timeout) and optional:
+            self._all_responses_ready.wait(grace)
+        with self._responses_lock:
+            responses = self._responses
+            self._expected = set()
+            self._optional = set()
+        return {action: responses.get(action) for _, action in requests}
+
+    def _on_disconnect(self, client, userdata, rc):
+        """Callback upon MQTT broker disconnection."""
+        self.connected = False
+
+    def discard_responses(self):
+        """Drop late or unsolicited responses left over from earlier calls."""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        """Disconnect from the TV and stop the MQTT network thread."""
+        self.connected = False
+        client = getattr(self, "_mqtt_client", None)
+        if client is not None:
+            sock = client.socket()
+            if isinstance(sock, ssl.SSLSocket):
+                # a TLS 1.3 session ticket only arrives after the handshake
+                sock.context.save_session(sock)
+            client.disconnect()
+            client.loop_stop()
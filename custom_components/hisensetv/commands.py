@@ -0,0 +1,124 @@
+""" Hisense Television per-host command queue. """
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from .const import COMMAND_MIN_INTERVAL_SEC, PRIORITY_NORMAL
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _QueuedCommand:
+    """A blocking call waiting for its turn, shared by every caller it serves."""
+
+    def __init__(self, func, priority: int, key: str, future):
+        self.func = func
+        self.priority = priority
+        self.key = key
+        self.future = future
+        self.waiters = 1
+        self.queued = time.monotonic()
+
+
+class HisenseTvCommandQueue:
+    """Runs the calls to one TV one at a time, most urgent first.
+
+    Calls are blocking functions run in the executor. Lower priorities go
+    first, calls of equal priority in order, and at most one call starts
+    every COMMAND_MIN_INTERVAL_SEC so the TV is not flooded. A call given
+    a key replaces a queued call with the same key, such as an older
+    volume target; both callers get the result of the newer one.
+    """
+
+    def __init__(self, hass, host: str, stats=None, min_interval: float = COMMAND_MIN_INTERVAL_SEC):
+        self.hass = hass
+        self.host = host
+        self._stats = stats
+        self._min_interval = min_interval
+        self._heap = []
+        self._by_key = {}
+        self._order = itertools.count()
+        self._last_start = 0.0
+        self._worker = None
+        self._running = None
+        self.superseded = 0
+
+    def __len__(self) -> int:
+        """Return the number of calls waiting to run."""
+        return len({id(command) for _, _, command in self._heap if not command.future.done()})
+
+    async def async_submit(self, func, priority: int = PRIORITY_NORMAL, key: str = None):
+        """Queue func and return its result once it has run."""
+        command = self._by_key.get(key) if key is not None else None
+        if command is not None:
+            _LOGGER.debug("Replacing queued '%s' call to %s", key, self.host)
+            command.func = func
+            command.waiters += 1
+            self.superseded += 1
+            if priority < command.priority:
+                # the heap entry keeps its place; an urgent replacement is queued anew
+                command.priority = priority
+                heapq.heappush(self._heap, (priority, next(self._order), command))
+        else:
+            command = _QueuedCommand(func, priority, key, self.hass.loop.create_future())
+            if key is not None:
+                self._by_key[key] = command
+            heapq.heappush(self._heap, (priority, next(self._order), command))
+        if self._worker is None:
+            self._worker = self.hass.async_create_task(self._async_run())
+
+        try:
+            return await asyncio.shield(command.future)
+        except asyncio.CancelledError:
+            command.waiters -= 1
+            if not command.waiters and not command.future.done():
+                # nobody waits for it any more, so it is dropped unsent
+                command.future.cancel()
+            raise
+
+    async def _async_run(self):
+        """Run queued calls until none are left."""
+        try:
+            while self._heap:
+                _, _, command = heapq.heappop(self._heap)
+                if command.future.done():
+                    # cancelled, or an earlier heap entry of a re-prioritized call
+                    continue
+                if self._by_key.get(command.key) is command:
+                    del self._by_key[command.key]
+                wait = self._last_start + self._min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._last_start = time.monotonic()
+                if self._stats is not None:
+                    self._stats.record("queue_wait", self._last_start - command.queued)
+                self._running = command
+                try:
+                    result = await self.hass.async_add_executor_job(command.func)
+                except Exception as e:
+                    if not command.future.done():
+                        command.future.set_exception(e)
+                else:
+                    if not command.future.done():
+                        command.future.set_result(result)
+                finally:
+                    self._running = None
+        finally:
+            self._worker = None
+
+    def rebind(self, host: str, stats=None):
+        """Send the calls still queued, and later ones, to the TV at host."""
+        self.host = host
+        self._stats = stats
+
+    def cancel(self):
+        """Drop every queued call, for shutdown."""
+        for command in [self._running] + [command for _, _, command in self._heap]:
+            if command is not None and not command.future.done():
+                command.future.cancel()
+        self._heap.clear()
+        self._by_key.clear()
+        if self._worker is not None:
+            self._worker.cancel()
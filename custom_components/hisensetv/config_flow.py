@@ -0,0 +1,96 @@
+""" Hisense Television config flow, for onboarding the TVs of a subnet at once. """
+from homeassistant import config_entries
+import homeassistant.helpers.config_validation as cv
+
+import logging
+import voluptuous as vol
+
+from homeassistant.const import CONF_HOST, CONF_MAC, CONF_NAME
+
+from .const import CONF_DEVICES, CONF_SUBNET, DOMAIN
+from .discovery import async_discover, local_subnet, normalize_mac
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _entry_data(tv: dict) -> dict:
+    """Return the config entry data of a discovered TV."""
+    return {
+        CONF_HOST: tv["host"],
+        CONF_MAC: tv["mac"],
+        CONF_NAME: "Hisense TV " + tv["mac"].replace(":", "")[-6:],
+    }
+
+
+class HisenseTvFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
+    """Scans a subnet for TVs and adds the ones picked, one entry per TV."""
+
+    VERSION = 1
+    CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_POLL
+
+    def __init__(self):
+        # mac -> discovered TV, for the select step
+        self._found = {}
+
+    async def async_step_user(self, user_input=None):
+        """Ask for the subnet to scan, then scan it."""
+        errors = {}
+        if user_input is not None:
+            try:
+                found = await async_discover(self.hass, user_input[CONF_SUBNET])
+            except ValueError:
+                errors[CONF_SUBNET] = "invalid_subnet"
+            else:
+                configured = {entry.unique_id: entry for entry in self._async_current_entries()}
+                # a TV without a MAC can neither be woken nor found again
+                found = [tv for tv in found if tv["mac"] is not None]
+                moved = [
+                    tv for tv in found
+                    if tv["mac"] in configured and configured[tv["mac"]].data.get(CONF_HOST) != tv["host"]
+                ]
+                for tv in moved:
+                    # the import step updates the address of a TV already added
+                    self._async_import(tv)
+                self._found = {tv["mac"]: tv for tv in found if tv["mac"] not in configured}
+                if self._found:
+                    return await self.async_step_select()
+                if moved:
+                    return self.async_abort(reason="devices_updated")
+                errors["base"] = "no_devices_found"
+
+        subnet = await self.hass.async_add_executor_job(local_subnet)
+        return self.async_show_form(
+            step_id="user",
+            data_schema=vol.Schema({vol.Required(CONF_SUBNET, default=subnet or ""): str}),
+            errors=errors,
+        )
+
+    async def async_step_select(self, user_input=None):
+        """Let the TVs to add be picked; each gets its own entry."""
+        options = {mac: f"{tv['host']} ({mac})" for mac, tv in self._found.items()}
+        if user_input is not None and user_input[CONF_DEVICES]:
+            first, *others = user_input[CONF_DEVICES]
+            # a flow creates a single entry, so the others get a flow each
+            for mac in others:
+                self._async_import(self._found[mac])
+            return await self.async_step_import(_entry_data(self._found[first]))
+
+        return self.async_show_form(
+            step_id="select",
+            data_schema=vol.Schema({vol.Required(CONF_DEVICES, default=list(options)): cv.multi_select(options)}),
+            errors={} if user_input is None else {"base": "no_devices_selected"},
+        )
+
+    def _async_import(self, tv: dict):
+        """Start an import flow of its own for tv."""
+        self.hass.async_create_task(
+            self.hass.config_entries.flow.async_init(
+                DOMAIN, context={"source": config_entries.SOURCE_IMPORT}, data=_entry_data(tv)
+            )
+        )
+
+    async def async_step_import(self, user_input):
+        """Add one TV, or update the address of one already added."""
+        await self.async_set_unique_id(normalize_mac(user_input[CONF_MAC]))
+        self._abort_if_unique_id_configured(updates={CONF_HOST: user_input[CONF_HOST]})
+        return self.async_create_entry(title=user_input[CONF_NAME], data=user_input)
@@ -0,0 +1,175 @@
+""" Hisense Television persistent MQTT connections. """
+from contextlib import contextmanager
+
+import logging
+import threading
+import time
+
+from .breaker import HisenseTvCircuitBreaker, HisenseTvUnavailableError, is_unreachable, tv_errors
+from .stats import HisenseTvStats
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class HisenseTvConnection:
+    """Long-lived, authenticated MQTT session to a single TV."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self._tv = None
+        self._lock = threading.RLock()
+        self._last_used = time.monotonic()
+        self.breaker = HisenseTvCircuitBreaker(host)
+        self.stats = HisenseTvStats(host)
+        self._listeners = []
+        self._sessions = 0
+
+    @property
+    def connected(self) -> bool:
+        """Return true if a session is currently open."""
+        return self._tv is not None and self._tv.connected
+
+    @property
+    def silent_time(self) -> float:
+        """Seconds since the open session last heard from the TV, or infinity without one."""
+        tv = self._tv
+        if tv is None or not tv.connected or tv.last_received is None:
+            return float("inf")
+        return time.monotonic() - tv.last_received
+
+    @property
+    def idle_time(self) -> float:
+        """Seconds since the session was last used."""
+        return time.monotonic() - self._last_used
+
+    def _connect(self, force: bool = False):
+        """Open a new session, failing fast while the circuit is open unless forced."""
+        if not force and not self.breaker.allow():
+            raise HisenseTvUnavailableError(
+                f"Host is unreachable, next connect to {self.host} in {self.breaker.remaining:.1f}s"
+            )
+        _LOGGER.debug("Opening MQTT session to HisenseTV at %s", self.host)
+        # imported here, in the executor, to keep hisensetv and paho off the
+        # event loop and out of platform setup
+        from .client import PooledHisenseTv
+
+        try:
+            with self.stats.measure("connect"):
+                self._tv = PooledHisenseTv(
+                    self.host, on_broadcast=self._dispatch, stats=self.stats
+                ).__enter__()
+        except tv_errors() as e:
+            if is_unreachable(e):
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        if self._sessions:
+            self.stats.record_reconnect()
+        self._sessions += 1
+
+    def _dispatch(self, topic: str, payload):
+        """Hand a broadcast to every listener."""
+        for listener in list(self._listeners):
+            try:
+                listener(topic, payload)
+            except Exception:
+                _LOGGER.exception("Error handling broadcast from %s", self.host)
+
+    def add_listener(self, listener):
+        """Register listener(topic, payload) for broadcasts; return a remover.
+
+        Listeners are called from the MQTT network thread.
+        """
+        self._listeners.append(listener)
+
+        def remove_listener():
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    def connect(self, force: bool = False):
+        """Open the session, and with it the broadcast subscription, if needed.
+
+        With force an open circuit is ignored, for callers that know the
+        TV just came up.
+        """
+        with self._lock:
+            if not self.connected:
+                self.close()
+                self._connect(force)
+
+    @contextmanager
+    def session(self):
+        """Yield the connected HisenseTv, reconnecting if necessary.
+
+        Use of the session is serialized, since the TV answers requests
+        on a single response topic.
+        """
+        with self._lock:
+            self.connect()
+            self._tv.discard_responses()
+            try:
+                yield self._tv
+            except tv_errors() as e:
+                self.close()
+                if is_unreachable(e):
+                    self.breaker.record_failure()
+                raise
+            finally:
+                self._last_used = time.monotonic()
+
+    def close(self):
+        """Close the session, if open."""
+        with self._lock:
+            if self._tv is not None:
+                _LOGGER.debug("Closing MQTT session to HisenseTV at %s", self.host)
+                self._tv.close()
+                self._tv = None
+
+    def close_if_idle(self, max_idle: float) -> bool:
+        """Close the session if unused for max_idle seconds or dropped.
+
+        Sessions carrying broadcasts for a listener are kept while connected.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._tv is None:
+                return False
+            if self.connected and (self._listeners or self.idle_time < max_idle):
+                return False
+            self.close()
+            return True
+        finally:
+            self._lock.release()
+
+
+class HisenseTvConnectionPool:
+    """Shared connections to all configured TVs, keyed by host."""
+
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> HisenseTvConnection:
+        """Return the connection for host, creating it on first use."""
+        with self._lock:
+            connection = self._connections.get(host)
+            if connection is None:
+                connection = self._connections[host] = HisenseTvConnection(host)
+            return connection
+
+    def evict_idle(self, max_idle: float):
+        """Close sessions that have been idle for max_idle seconds."""
+        with self._lock:
+            connections = list(self._connections.values())
+        for connection in connections:
+            if connection.close_if_idle(max_idle):
+                _LOGGER.debug("Evicted idle session to %s", connection.host)
+
+    def close_all(self):
+        """Close every open session."""
+        with self._lock:
+            connections = list(self._connections.values())
+        for connection in connections:
+            connection.close()
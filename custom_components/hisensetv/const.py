@@ -2,12 +2,65 @@
 DOMAIN = "hisensetv"
 
 ATTR_COMMAND_NAME = "command_name"
+ATTR_COMMANDS = "commands"
+ATTR_DELAY = "delay"
+ATTR_MAX_PARALLEL = "max_parallel"
 ATTR_PARAMS = "params"
+ATTR_POWER = "power"
+ATTR_REPEAT = "repeat"
+ATTR_SOURCE = "source"
+ATTR_TIMEOUT = "timeout"
+ATTR_VOLUME = "volume"
 
 COMMANDS = ("up", "down", "right", "left", "back", "exit", "menu", "power", "ok", "volume_up", "volume_down", "forwards", "backs", "stop", "play", "pause")
 
+# key names sent to the TV's remote_service for each command
+COMMAND_KEYS = {
+    "up": "KEY_UP",
+    "down": "KEY_DOWN",
+    "right": "KEY_RIGHT",
+    "left": "KEY_LEFT",
+    "back": "KEY_RETURNS",
+    "exit": "KEY_EXIT",
+    "menu": "KEY_MENU",
+    "power": "KEY_POWER",
+    "ok": "KEY_OK",
+    "volume_up": "KEY_VOLUMEUP",
+    "volume_down": "KEY_VOLUMEDOWN",
+    "forwards": "KEY_FORWARDS",
+    "backs": "KEY_BACKS",
+    "stop": "KEY_STOP",
+    "play": "KEY_PLAY",
+    "pause": "KEY_PAUSE",
+}
+
+ARP_TABLE = "/proc/net/arp"
+
+BREAKER_FAILURE_THRESHOLD = 2
+BREAKER_OPEN_MAX_SEC = 300
+BREAKER_OPEN_MIN_SEC = 5
+
+# per-TV limit of a broadcast, long enough for a TV to wake
+BROADCAST_TIMEOUT_SEC = 40
+
+BROADCAST_TOPIC = "/remoteapp/mobile/broadcast/#"
+BROADCAST_TOPIC_STATE = "/remoteapp/mobile/broadcast/ui_service/state"
+BROADCAST_TOPIC_VOLUME = "/remoteapp/mobile/broadcast/platform_service/actions/volumechange"
+
+# shortest time between two calls to one TV, which drops keys sent faster
+COMMAND_MIN_INTERVAL_SEC = 0.05
+# commands that jump the queue of navigation keys
+COMMANDS_URGENT = ("power", "stop")
+
+CONNECTION_EVICT_INTERVAL_SEC = 60
+CONNECTION_IDLE_TIMEOUT_SEC = 300
+
+CONF_DEVICES = "devices"
 CONF_MODEL = "model"
+CONF_OFF_AFTER_MISSES = "off_after_misses"
 CONF_PAUSE_RESUME = "pause_resume"
+CONF_PROBE_TIMEOUT = "probe_timeout"
+CONF_SUBNET = "subnet"
 
 DATA_TV_STATUS = "tv_status_data"
 
@@ -17,15 +70,97 @@ DEFAULT_PING_TIMEOUT = 1
 DEFAULT_MAX_VOLUME = 100
 DEFAULT_MIN_VOLUME = 0
 DEFAULT_MODEL = "v1"
+DEFAULT_OFF_AFTER_MISSES = 2
+DEFAULT_MQTT_PORT = 36669
+
+# diagnostics alone are written at most this often, as every poll changes them
+DIAGNOSTICS_WRITE_INTERVAL_SEC = 300
+
+# time for a host answering on the port to accept the TV's MQTT login
+DISCOVERY_IDENTIFY_TIMEOUT_SEC = 5
+# largest subnet the config flow scans, a /22
+DISCOVERY_MAX_ADDRESSES = 1024
+DISCOVERY_MAX_PARALLEL = 64
+# subnet swept for a TV that changed address, around its last or broadcast address
+DISCOVERY_PREFIX_LENGTH = 24
+DISCOVERY_PROBE_TIMEOUT_SEC = 0.5
 
 DOMAIN_DATA = "hisense_data"
 
+EVENT_BROADCAST_RESULT = "hisensetv_broadcast_result"
+EVENT_SEND_COMMANDS_RESULT = "hisensetv_send_commands_result"
+EVENT_SERVICE_RESULT = "hisensetv_service_result"
+
 HISENSETV_DEVICES = "hisensetv_devices"
 
 ICON_TV = "mdi:television"
 
-PING_RESPONSE_WAIT_SEC = 5
+MAX_COMMAND_REPEAT = 50
+
+OPTIMISTIC_CONFIRM_SEC = 15
 
+# a broadcast this recent shows the TV is up, whatever a probe says
+POWER_PUSH_FRESH_SEC = 30
+# a session heard from this recently shows the TV is up; paho keeps a dead
+# session connected until up to twice its 60 second keepalive has passed
+POWER_SESSION_FRESH_SEC = 30
+
+# order of queued calls to a TV, lowest first
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+POLL_FAST_INTERVAL_SEC = 5
+POLL_FAST_WINDOW_SEC = 30
+POLL_JITTER = 0.1
+POLL_OFF_BACKOFF_FACTOR = 2
+POLL_OFF_MAX_INTERVAL_SEC = 300
+# first polls after startup are spread over this many seconds
+POLL_STARTUP_SPREAD_SEC = 5
+
+# entities a service call drives at the same time
+SERVICE_MAX_PARALLEL = 10
+
+# a TV that stays unreachable is looked up by MAC, backing off while it is just off
+REDISCOVERY_CACHE_TTL_SEC = 3600
+REDISCOVERY_MAX_INTERVAL_SEC = 3600
+REDISCOVERY_MIN_INTERVAL_SEC = 300
+# however many TVs are missing, a subnet is swept at most this often
+REDISCOVERY_SWEEP_COOLDOWN_SEC = 60
+# a wake that has not reached the TV by then looks it up by MAC
+REDISCOVERY_WAKE_AFTER_SEC = 10
+SERVICE_BROADCAST = "broadcast"
 SERVICE_SEND_COMMAND = "send_command"
+SERVICE_SEND_COMMANDS = "send_commands"
 SERVICE_UPDATE_SOURCES = "update_sources"
 
+SOURCE_CACHE_SAVE_DELAY_SEC = 10
+SOURCE_CACHE_TTL_SEC = 86400
+
+# name of the tuner input, which is reported as 'livetv' rather than a source switch
+LIVETV_SOURCE = "TV"
+
+STATETYPE_APP = "app"
+STATETYPE_LIVETV = "livetv"
+STATETYPE_SLEEP = "fake_sleep_0"
+STATETYPE_SOURCE = "sourceswitch"
+
+# upper bounds of the latency histogram buckets, in milliseconds
+STATS_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+STORAGE_KEY = "hisensetv.sources"
+STORAGE_VERSION = 1
+
+# polls in a row a TV may leave gettvstate unanswered, while answering the
+# rest, before it is no longer asked; it is asked again after TV_STATE_RETRY_SEC
+TV_STATE_MAX_MISSES = 3
+TV_STATE_RETRY_SEC = 3600
+# a TV that never answered gettvstate is waited for this long after the rest
+TV_STATE_GRACE_SEC = 1
+
+VOLUME_DEBOUNCE_SEC = 0.1
+
+WAKE_PACKET_INTERVAL_SEC = 1
+WAKE_PROBE_INTERVAL_SEC = 0.25
+WAKE_PROBE_TIMEOUT_SEC = 0.5
+WAKE_TIMEOUT_SEC = 30
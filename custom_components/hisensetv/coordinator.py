@@ -0,0 +1,586 @@
+""" Hisense Television per-host state coordinator. """
+import asyncio
+import logging
+import sys
+import time
+
+from homeassistant.const import STATE_OFF, STATE_ON
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+from .breaker import HisenseTvUnavailableError, is_unreachable, tv_errors
+from .commands import HisenseTvCommandQueue
+from .const import (
+    BROADCAST_TOPIC_STATE,
+    BROADCAST_TOPIC_VOLUME,
+    DEFAULT_OFF_AFTER_MISSES,
+    OPTIMISTIC_CONFIRM_SEC,
+    POLL_FAST_INTERVAL_SEC,
+    POWER_SESSION_FRESH_SEC,
+    PRIORITY_BACKGROUND,
+    PRIORITY_NORMAL,
+    REDISCOVERY_MAX_INTERVAL_SEC,
+    REDISCOVERY_MIN_INTERVAL_SEC,
+    REDISCOVERY_WAKE_AFTER_SEC,
+    SOURCE_CACHE_TTL_SEC,
+    TV_STATE_GRACE_SEC,
+    TV_STATE_MAX_MISSES,
+    TV_STATE_RETRY_SEC,
+    VOLUME_DEBOUNCE_SEC,
+    WAKE_PACKET_INTERVAL_SEC,
+    WAKE_PROBE_INTERVAL_SEC,
+    WAKE_PROBE_TIMEOUT_SEC,
+    WAKE_TIMEOUT_SEC,
+)
+from .power import PowerEstimator
+from .probe import async_probe
+from .scheduler import AdaptivePollScheduler
+from .snapshot import HisenseTvSnapshot, parse_tv_state
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class HisenseTvCoordinator:
+    """Polls one TV and shares its state with every entity bound to it."""
+
+    def __init__(
+        self, hass, host: str, connection, source_cache, scan_interval: float, probe_timeout: float,
+        off_after_misses: int = DEFAULT_OFF_AFTER_MISSES,
+    ):
+        self.hass = hass
+        self.host = host
+        self.connection = connection
+        self.commands = HisenseTvCommandQueue(hass, host, connection.stats)
+        self.scheduler = AdaptivePollScheduler(host, scan_interval)
+        self.probe_timeout = probe_timeout
+        self.power = PowerEstimator(off_after_misses)
+        self.state = STATE_OFF
+        self.volume = None
+        self.app = None
+        self._source_cache = source_cache
+        cached = source_cache.get(host)
+        self.source = cached.get("source")
+        self.source_map = dict(cached.get("sources", {}))
+        self.source_list = list(self.source_map)
+        self._sources_updated = cached.get("updated", 0)
+        self._listeners = []
+        self._refresh_lock = asyncio.Lock()
+        self._next_refresh = 0.0
+        self._unsub_refresh = None
+        self._volume_target = None
+        self._volume_task = None
+        self._wake_task = None
+        self.wake_latency = None
+        # false until the first poll completes, while restored state is shown
+        self.refreshed = False
+        # gettvstate is not asked until then, of a TV that stopped answering it
+        self._tv_state_retry = 0.0
+        self._tv_state_misses = 0
+        self._tv_state_answered = False
+        # for finding the TV again after its address changes
+        self.mac = None
+        self.broadcast_address = None
+        self.rediscover = None
+        self._next_rediscovery = 0.0
+        self._rediscovery_interval = REDISCOVERY_MIN_INTERVAL_SEC
+        # attribute -> (expected value, value before the command, confirm deadline)
+        self._pending = {}
+        self._remove_broadcast_listener = connection.add_listener(self._handle_broadcast)
+
+    def configure(self, scan_interval: float, probe_timeout: float, off_after_misses: int = DEFAULT_OFF_AFTER_MISSES):
+        """Merge the settings of another entity bound to this TV."""
+        self.scheduler.scan_interval = min(self.scheduler.scan_interval, scan_interval)
+        self.probe_timeout = max(self.probe_timeout, probe_timeout)
+        self.power.off_after_misses = max(self.power.off_after_misses, off_after_misses)
+
+    @callback
+    def async_restore(self, state: str = None, volume: int = None, source: str = None):
+        """Seed the state last recorded by Home Assistant, until the first poll."""
+        if self.refreshed:
+            return
+        if state in (STATE_ON, STATE_OFF):
+            self.state = state
+        if self.volume is None:
+            self.volume = volume
+        if self.source is None:
+            self.source = source
+
+    @callback
+    def async_start(self):
+        """Schedule the first poll, in the background."""
+        self._async_schedule_refresh(self.scheduler.initial_delay())
+
+    @callback
+    def _async_schedule_refresh(self, delay: float):
+        """Poll again after delay seconds, replacing any pending poll."""
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+        self._next_refresh = time.monotonic() + delay
+        self._unsub_refresh = async_call_later(self.hass, delay, self._async_handle_refresh_interval)
+
+    async def _async_handle_refresh_interval(self, now):
+        """Run a scheduled poll."""
+        self._unsub_refresh = None
+        await self.async_refresh()
+
+    @callback
+    def async_note_activity(self):
+        """Poll more often for a while after a command or state change."""
+        self.scheduler.activity()
+        if self._next_refresh - time.monotonic() > POLL_FAST_INTERVAL_SEC:
+            self._async_schedule_refresh(POLL_FAST_INTERVAL_SEC)
+
+    @property
+    def snapshot(self) -> HisenseTvSnapshot:
+        """Return the current state of the TV."""
+        return HisenseTvSnapshot(self.state, self.volume, self.source, self.app)
+
+    @property
+    def diagnostics(self) -> dict:
+        """Return latency, failure and session statistics of the TV."""
+        diagnostics = self.connection.stats.as_dict()
+        diagnostics["circuit"] = self.connection.breaker.state
+        diagnostics["wake_latency_s"] = None if self.wake_latency is None else round(self.wake_latency, 1)
+        diagnostics["power_misses"] = self.power.misses
+        diagnostics["queued_commands"] = len(self.commands)
+        diagnostics["superseded_commands"] = self.commands.superseded
+        return diagnostics
+
+    @callback
+    def async_add_listener(self, update_callback):
+        """Register update_callback for state changes; return a remover."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener():
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @property
+    def has_listeners(self) -> bool:
+        """Return true if any entity is bound to the TV."""
+        return bool(self._listeners)
+
+    @callback
+    def async_update_listeners(self):
+        """Push the current state to every bound entity."""
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    @callback
+    def async_set_optimistic(self, attribute: str, value):
+        """Show value right away, pending confirmation by a poll or broadcast."""
+        pending = self._pending.get(attribute)
+        previous = getattr(self, attribute) if pending is None else pending[1]
+        self._pending[attribute] = (value, previous, time.monotonic() + OPTIMISTIC_CONFIRM_SEC)
+        setattr(self, attribute, value)
+        self.async_update_listeners()
+
+    @callback
+    def _async_rollback(self, attribute: str):
+        """Restore the value an optimistic update replaced."""
+        pending = self._pending.pop(attribute, None)
+        if pending is not None:
+            _LOGGER.debug("Rolling back %s of %s to '%s'", attribute, self.host, pending[1])
+            setattr(self, attribute, pending[1])
+            self.async_update_listeners()
+
+    def _reconcile(self, attribute: str, observed):
+        """Return the value to show for attribute, given what a poll observed.
+
+        A pending optimistic value is kept until the TV confirms it or the
+        confirmation window ends, after which the observed value wins.
+        """
+        pending = self._pending.get(attribute)
+        if pending is None:
+            return observed
+        expected, _, deadline = pending
+        if observed == expected:
+            del self._pending[attribute]
+        elif time.monotonic() < deadline:
+            return expected
+        else:
+            del self._pending[attribute]
+            _LOGGER.debug("HisenseTV at %s reports %s '%s', expected '%s'", self.host, attribute, observed, expected)
+        return observed
+
+    async def async_call(self, func, optimistic: tuple = None, priority: int = PRIORITY_NORMAL, key: str = None):
+        """Run func(tv) on the shared session, through the command queue.
+
+        Calls made while the TV is waking are held until it is ready. An
+        optimistic (attribute, value) pair is shown right away and rolled
+        back if the call fails. A call with a key replaces a queued call
+        with the same key.
+        """
+        if self._wake_task is not None:
+            await asyncio.shield(self._wake_task)
+        self.async_note_activity()
+        if optimistic is not None:
+            self.async_set_optimistic(*optimistic)
+
+        def call():
+            with self.connection.session() as tv:
+               return func(tv)
+
+        try:
+            return await self.commands.async_submit(call, priority, key)
+        except tv_errors() as e:
+            if optimistic is not None:
+                self._async_rollback(optimistic[0])
+            if isinstance(e, HisenseTvUnavailableError):
+               _LOGGER.debug("Skipping call to unreachable HisenseTV at %s: %s", self.host, e)
+            elif is_unreachable(e):
+               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
+            else:
+               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
+               raise
+
+    async def async_wake(self, send_magic_packet):
+        """Wake the TV and wait until it accepts a session.
+
+        send_magic_packet is a blocking callable sending one Wake-on-LAN
+        packet. Concurrent calls share the wake sequence in progress.
+        """
+        if self._wake_task is None:
+            self._wake_task = self.hass.async_create_task(self._async_wake(send_magic_packet))
+        await asyncio.shield(self._wake_task)
+
+    async def _async_wake(self, send_magic_packet):
+        """Repeat magic packets until the MQTT broker is up, then open a session."""
+        start = time.monotonic()
+        self.async_set_optimistic("state", STATE_ON)
+        try:
+            next_packet = start
+            rediscovered = False
+            while True:
+                now = time.monotonic()
+                if not rediscovered and now - start > REDISCOVERY_WAKE_AFTER_SEC:
+                    # the packet goes by MAC, so the TV may be up at another address
+                    rediscovered = True
+                    await self._async_rediscover(force=True)
+                if now - start > WAKE_TIMEOUT_SEC:
+                    _LOGGER.warning("HisenseTV at %s did not wake within %ds", self.host, WAKE_TIMEOUT_SEC)
+                    self._async_rollback("state")
+                    return
+                if now >= next_packet:
+                    await self.hass.async_add_executor_job(send_magic_packet)
+                    next_packet = now + WAKE_PACKET_INTERVAL_SEC
+                if await async_probe(self.host, timeout=WAKE_PROBE_TIMEOUT_SEC):
+                    try:
+                        # pre-warm the session so queued commands go out at once
+                        await self.hass.async_add_executor_job(self.connection.connect, True)
+                        break
+                    except tv_errors() as e:
+                        _LOGGER.debug("Broker of %s not ready yet: %s", self.host, e)
+                await asyncio.sleep(WAKE_PROBE_INTERVAL_SEC)
+
+            self.power.report_state(True)
+            # a poll may have settled the state to off while the TV was slow to wake
+            if self._async_apply({"state": STATE_ON}):
+                self.async_update_listeners()
+            self.wake_latency = time.monotonic() - start
+            _LOGGER.info("HisenseTV at %s ready %.1fs after wake", self.host, self.wake_latency)
+        finally:
+            self._wake_task = None
+            self.async_note_activity()
+
+    async def async_set_volume(self, volume: int):
+        """Set the volume, collapsing bursts of requests to the latest target.
+
+        The new volume is shown immediately; the TV is sent only the most
+        recent target once the debounce window or the previous write ends.
+        """
+        self.volume = volume
+        self._volume_target = volume
+        self.async_update_listeners()
+        if self._volume_task is None:
+            self._volume_task = self.hass.async_create_task(self._async_send_volume())
+
+    async def _async_send_volume(self):
+        """Send pending volume targets until none are left."""
+        try:
+            await asyncio.sleep(VOLUME_DEBOUNCE_SEC)
+            while self._volume_target is not None:
+                volume, self._volume_target = self._volume_target, None
+                _LOGGER.debug("set_volume - Volume='%d'", volume)
+                await self.async_call(lambda tv: tv.set_volume(volume), key="volume")
+        except tv_errors() as e:
+            _LOGGER.error("Unable to set volume of HisenseTV at %s: %s", self.host, e)
+        finally:
+            self._volume_task = None
+
+    @property
+    def sources_stale(self) -> bool:
+        """Return true if the source list is due for revalidation."""
+        return time.time() - self._sources_updated > SOURCE_CACHE_TTL_SEC
+
+    @callback
+    def _async_store_sources(self):
+        """Persist the source list and current source."""
+        self._source_cache.async_set(self.host, self.source_map, self.source, self._sources_updated)
+
+    async def async_write_volume(self, volume: int) -> bool:
+        """Set the volume at once, without debouncing; return true if sent."""
+
+        def write(tv):
+            tv.set_volume(volume)
+            return True
+
+        return bool(await self.async_call(write, ("volume", volume), key="volume"))
+
+    async def async_select_source(self, source: str) -> bool:
+        """Select input source; return true if the TV was sent it."""
+        source_int = self.source_map.get(source)
+        _LOGGER.debug("select_source - SourceInt='%s'", source_int)
+        if source_int is None:
+            _LOGGER.error("Unknown source '%s' for HisenseTV at %s", source, self.host)
+            return False
+
+        def select(tv):
+            tv.set_source(source_int, source)
+            return True
+
+        selected = await self.async_call(select, ("source", source), key="source")
+        self._async_store_sources()
+        return bool(selected)
+
+    async def async_refresh(self):
+        """Refresh the TV state and schedule the next poll."""
+        if self._refresh_lock.locked():
+            # share the result of the poll already in progress
+            async with self._refresh_lock:
+                return
+        async with self._refresh_lock:
+            state = self.state
+            await self._async_refresh()
+            self.refreshed = True
+            if self.state != state or self.power.undecided:
+                # confirm changes, and settle a missed poll, quickly
+                self.scheduler.activity()
+            self._async_schedule_refresh(self.scheduler.next_interval(self.state == STATE_ON))
+        self.async_update_listeners()
+
+    async def _async_refresh(self):
+        """Retrieve the latest data without interval enforcing."""
+        _LOGGER.debug("_update - starting...")
+        start = time.monotonic()
+        is_on = await async_probe(self.host, timeout=self.probe_timeout)
+        self.connection.stats.record_probe(time.monotonic() - start, is_on)
+        observed = {}
+        if is_on:
+            # the port answers, so let the next session attempt through an open circuit
+            self.connection.breaker.half_open()
+            # while a session is up, volume, source and power changes are pushed by the TV
+            if not self.connection.connected or not self.source_list or self.sources_stale:
+                # queued behind pending commands, which the poll would otherwise delay
+                responses = await self.commands.async_submit(self._request_state, PRIORITY_BACKGROUND)
+                if responses is None:
+                    is_on = False
+                else:
+                    if responses.get("sourcelist") is not None:
+                        self._apply_sources(responses["sourcelist"])
+                    observed = self._observed(responses)
+                    self._async_store_sources()
+
+        if "state" in observed:
+            self.power.report_state(observed["state"] == STATE_ON)
+        # a dropped session looks connected until its keepalive runs out
+        session_alive = self.connection.silent_time < POWER_SESSION_FRESH_SEC
+        power = self.power.estimate(is_on, session_alive)
+        if power is False and not is_on and await self._async_rediscover():
+            # poll again at the new address
+            await self._async_refresh()
+            return
+        if power:
+            self._next_rediscovery = 0.0
+            self._rediscovery_interval = REDISCOVERY_MIN_INTERVAL_SEC
+        if power is None:
+            _LOGGER.debug("HisenseTV at %s missed %d poll(s), still %s", self.host, self.power.misses, self.state)
+            observed.pop("state", None)
+        else:
+            observed["state"] = STATE_ON if power else STATE_OFF
+            if not power:
+                observed["app"] = None
+        self._async_apply(observed)
+
+    async def _async_rediscover(self, force: bool = False) -> bool:
+        """Look the TV up by MAC address; return true if it moved.
+
+        Lookups back off while the TV stays unreachable, since it is most
+        likely just off; force skips the wait.
+        """
+        if self.rediscover is None or self.mac is None:
+            return False
+        now = time.monotonic()
+        if not force and now < self._next_rediscovery:
+            return False
+        self._next_rediscovery = now + self._rediscovery_interval
+        self._rediscovery_interval = min(self._rediscovery_interval * 2, REDISCOVERY_MAX_INTERVAL_SEC)
+        return await self.rediscover()
+
+    async def async_rebind(self, host: str, connection):
+        """Move to the address host, with its connection."""
+        old_connection = self.connection
+        self._remove_broadcast_listener()
+        self.host = host
+        self.connection = connection
+        self.commands.rebind(host, connection.stats)
+        self._remove_broadcast_listener = connection.add_listener(self._handle_broadcast)
+        self.power.misses = 0
+        self.connection.breaker.half_open()
+        self._async_store_sources()
+        await self.hass.async_add_executor_job(old_connection.close)
+        self.async_note_activity()
+
+    def _request_state(self):
+        """Query a TV that is on, in one session and one burst of requests.
+
+        Volume is always requested, TV state unless the TV stopped
+        answering it, and the source list when it is missing or stale. This also opens the session that carries the
+        state broadcasts. Returns the responses by action, or None if the
+        TV could not be queried.
+        """
+        requests = [("platform_service", "getvolume")]
+        optional = ()
+        if time.monotonic() >= self._tv_state_retry:
+            requests.append(("ui_service", "gettvstate"))
+            if not self._tv_state_answered:
+                # a model that does not know it would hold up every poll
+                optional = ("gettvstate",)
+        # refresh source list, if empty (not cached yet) or expired;
+        # a stale list stays usable until then
+        if not self.source_list or self.sources_stale:
+            requests.append(("ui_service", "sourcelist"))
+        try:
+            with self.connection.session() as tv, self.connection.stats.measure("snapshot"):
+                return tv.request(*requests, optional=optional, grace=TV_STATE_GRACE_SEC)
+        except tv_errors() as exception_instance:
+            if isinstance(exception_instance, HisenseTvUnavailableError):
+                _LOGGER.debug(exception_instance)
+            else:
+                _LOGGER.error(exception_instance)
+            return None
+
+    def _observed(self, responses: dict) -> dict:
+        """Return the snapshot fields settled by the responses of a TV."""
+        observed = {}
+        volume_info = responses.get("getvolume")
+        if isinstance(volume_info, dict) and volume_info.get("volume_value") is not None:
+            observed["volume"] = volume_info["volume_value"]
+        if "gettvstate" in responses:
+            if responses["gettvstate"] is not None:
+                self._tv_state_answered = True
+                self._tv_state_misses = 0
+            elif volume_info is not None:
+                # the TV answers other requests, so it may not know this one
+                self._tv_state_misses += 1
+                if self._tv_state_misses >= TV_STATE_MAX_MISSES:
+                    _LOGGER.info(
+                        "HisenseTV at %s does not report its input, relying on broadcasts for %ds",
+                        self.host, TV_STATE_RETRY_SEC,
+                    )
+                    self._tv_state_misses = 0
+                    self._tv_state_retry = time.monotonic() + TV_STATE_RETRY_SEC
+            observed.update(parse_tv_state(responses["gettvstate"], self.source_list))
+        return observed
+
+    @callback
+    def _async_apply(self, observed: dict) -> bool:
+        """Apply the snapshot fields a poll or broadcast observed.
+
+        Pending optimistic values are reconciled, and a volume reported
+        while a write is in progress is ignored. Returns true if the
+        snapshot changed.
+        """
+        current = self.snapshot
+        if "state" in observed:
+            self.state = self._reconcile("state", observed["state"])
+        if "volume" in observed and self._volume_task is None:
+            self.volume = observed["volume"]
+        if "source" in observed:
+            self.source = self._reconcile("source", observed["source"])
+        if "app" in observed:
+            self.app = observed["app"]
+        if self.snapshot == current:
+            return False
+        _LOGGER.debug("HisenseTV at %s is now %s", self.host, self.snapshot)
+        return True
+
+    def _refresh_sources(self, tv) -> bool:
+        """Refresh source list; return true if the TV sent one."""
+        _LOGGER.debug("_refresh_sources - starting...")
+        source_list = tv.get_sources()
+        if source_list is not None:
+            self._apply_sources(source_list)
+        return source_list is not None
+
+    def _apply_sources(self, source_list: list):
+        """Replace the source list with one sent by the TV."""
+        source_map = {}
+        for source in source_list:
+            # Displayname and sourename appear to always be the same for me
+            source_map[source.get("sourcename")] = source.get("sourceid")
+        self.source_map = source_map
+        self.source_list = list(source_map)
+        self._sources_updated = time.time()
+
+    async def async_refresh_sources(self) -> bool:
+        """Request and process the source list from the TV.
+
+        Returns false if the TV could not be reached.
+        """
+        refreshed = await self.async_call(self._refresh_sources, priority=PRIORITY_BACKGROUND)
+        self._async_store_sources()
+        self.async_update_listeners()
+        return bool(refreshed)
+
+    def _handle_broadcast(self, topic: str, payload):
+        """Forward a broadcast from the MQTT thread to the event loop."""
+        self.hass.add_job(self._async_handle_broadcast, topic, payload)
+
+    @callback
+    def _async_handle_broadcast(self, topic: str, payload):
+        """Apply a state change pushed by the TV."""
+        self.power.push()
+        if self._apply_broadcast(topic, payload):
+            self.async_note_activity()
+            self.async_update_listeners()
+
+    def _apply_broadcast(self, topic: str, payload) -> bool:
+        """Update power, volume and source from a broadcast.
+
+        Returns true if anything changed.
+        """
+        if not isinstance(payload, dict):
+            return False
+
+        changed = False
+        if topic == BROADCAST_TOPIC_VOLUME:
+            volume = payload.get("volume_value")
+            # while a write is in progress this is only an echo of an older target
+            if volume is not None and self._volume_task is None and volume != self.volume:
+                self.volume = volume
+                changed = True
+                _LOGGER.debug("broadcast - Volume='%s'", volume)
+        elif topic == BROADCAST_TOPIC_STATE:
+            # broadcasts are authoritative and settle any optimistic state
+            observed = parse_tv_state(payload, self.source_list)
+            if "state" in observed:
+                self.power.report_state(observed["state"] == STATE_ON)
+            for attribute in observed:
+                self._pending.pop(attribute, None)
+            if self._async_apply(observed):
+                if "source" in observed:
+                    self._async_store_sources()
+                changed = True
+        return changed
+
+    @callback
+    def async_shutdown(self):
+        """Stop polling and receiving broadcasts, and drop queued calls."""
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+            self._unsub_refresh = None
+        self._remove_broadcast_listener()
+        self.commands.cancel()
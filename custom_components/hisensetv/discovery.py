@@ -0,0 +1,204 @@
+""" Hisense Television network discovery. """
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+
+from .const import (
+    ARP_TABLE,
+    DEFAULT_MQTT_PORT,
+    DISCOVERY_IDENTIFY_TIMEOUT_SEC,
+    DISCOVERY_MAX_ADDRESSES,
+    DISCOVERY_MAX_PARALLEL,
+    DISCOVERY_PREFIX_LENGTH,
+    DISCOVERY_PROBE_TIMEOUT_SEC,
+    REDISCOVERY_CACHE_TTL_SEC,
+    REDISCOVERY_SWEEP_COOLDOWN_SEC,
+)
+from .probe import async_probe
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def normalize_mac(mac: str) -> str:
+    """Return mac as lowercase, colon-separated hex pairs."""
+    digits = "".join(c for c in mac.lower() if c in "0123456789abcdef")
+    return ":".join(digits[i:i + 2] for i in range(0, len(digits), 2))
+
+
+def read_arp_table(path: str = ARP_TABLE) -> dict:
+    """Return the hosts the kernel's neighbor table holds for each MAC.
+
+    Blocking; an unreadable table (not Linux, or no access) is empty.
+    """
+    table = {}
+    try:
+        with open(path) as arp:
+            next(arp, None)
+            for line in arp:
+                fields = line.split()
+                # IP address, HW type, flags, HW address, mask, device
+                if len(fields) < 4 or fields[2] == "0x0":
+                    continue
+                table.setdefault(normalize_mac(fields[3]), []).append(fields[0])
+    except OSError as e:
+        _LOGGER.debug("Unable to read %s: %s", path, e)
+    return table
+
+
+def local_subnet(prefix_length: int = DISCOVERY_PREFIX_LENGTH):
+    """Return the subnet of this machine's default route, or None if it has none."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            # a UDP connect only picks the route; nothing is sent
+            sock.connect(("10.255.255.255", 1))
+            address = sock.getsockname()[0]
+        except OSError:
+            return None
+    return str(ipaddress.ip_network(f"{address}/{prefix_length}", strict=False))
+
+
+def subnet_of(address: str, prefix_length: int = DISCOVERY_PREFIX_LENGTH) -> str:
+    """Return the subnet of address, e.g. of its broadcast address."""
+    return str(ipaddress.ip_network(f"{address}/{prefix_length}", strict=False))
+
+
+def is_hisense_tv(host: str, timeout: float = DISCOVERY_IDENTIFY_TIMEOUT_SEC) -> bool:
+    """Return true if host accepts the TV's MQTT login. Blocking."""
+    # imported here, in the executor, to keep hisensetv and paho off the event loop
+    from .client import identify
+
+    return identify(host, timeout)
+
+
+async def async_sweep(
+    hosts: list, port: int = DEFAULT_MQTT_PORT, timeout: float = DISCOVERY_PROBE_TIMEOUT_SEC,
+    max_parallel: int = DISCOVERY_MAX_PARALLEL,
+) -> list:
+    """Probe port on every host, max_parallel at a time; return those answering.
+
+    Probing also leaves each live host in the neighbor table, answering
+    or not.
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def probe(host):
+        async with semaphore:
+            return await async_probe(host, port, timeout)
+
+    results = await asyncio.gather(*(probe(host) for host in hosts))
+    return [host for host, answered in zip(hosts, results) if answered]
+
+
+async def async_discover(hass, subnet: str, max_parallel: int = DISCOVERY_MAX_PARALLEL) -> list:
+    """Scan subnet for Hisense TVs; return a dict with host and mac for each.
+
+    subnet is a network such as 192.168.1.0/24, of at most
+    DISCOVERY_MAX_ADDRESSES addresses. A TV is a host answering on the
+    MQTT port that accepts the TV's MQTT login; its MAC is read from the
+    neighbor table the scan filled, and is None where the table is
+    unavailable.
+    """
+    network = ipaddress.ip_network(subnet, strict=False)
+    if network.num_addresses > DISCOVERY_MAX_ADDRESSES:
+        raise ValueError(f"{subnet} is larger than {DISCOVERY_MAX_ADDRESSES} addresses")
+    hosts = [str(host) for host in network.hosts()]
+    start = time.monotonic()
+    found = await async_sweep(hosts, max_parallel=max_parallel)
+    accepted = await asyncio.gather(*(hass.async_add_executor_job(is_hisense_tv, host) for host in found))
+    found = [host for host, is_tv in zip(found, accepted) if is_tv]
+    table = await hass.async_add_executor_job(read_arp_table)
+    macs = {host: mac for mac, addresses in table.items() for host in addresses}
+    _LOGGER.info(
+        "Found %d HisenseTV(s) among %d hosts of %s in %.1fs", len(found), len(hosts), subnet, time.monotonic() - start
+    )
+    return [{"host": host, "mac": macs.get(host)} for host in found]
+
+
+class HisenseTvResolver:
+    """Finds the current address of a TV from its MAC address.
+
+    The neighbor table is consulted first. If it has no address at all for
+    the MAC, the subnet is swept on the MQTT port and the table read
+    again; a sweep cannot tell TVs apart by itself, so only the table
+    decides. A TV the table still places at its old address is assumed to
+    be off rather than moved. Results are cached for
+    REDISCOVERY_CACHE_TTL_SEC.
+
+    Every TV looked up at the same time shares one table read, and one
+    sweep of their subnet; a subnet is swept at most once every
+    REDISCOVERY_SWEEP_COOLDOWN_SEC, however many TVs are missing.
+    """
+
+    def __init__(
+        self, hass, ttl: float = REDISCOVERY_CACHE_TTL_SEC, cooldown: float = REDISCOVERY_SWEEP_COOLDOWN_SEC
+    ):
+        self.hass = hass
+        self._ttl = ttl
+        self._cooldown = cooldown
+        self._cache = {}
+        self._table = None
+        # subnet -> the sweep in progress, and when the next may start
+        self._sweeps = {}
+        self._next_sweep = {}
+
+    async def async_resolve(self, mac: str, subnet_address: str, exclude: str = None):
+        """Return the address of the TV with mac, other than exclude, or None.
+
+        subnet_address is any address of the TV's subnet, such as its
+        broadcast address or its last known address.
+        """
+        mac = normalize_mac(mac)
+        cached = self._cache.get(mac)
+        if cached is not None and cached[1] > time.monotonic() and cached[0] != exclude:
+            return cached[0]
+
+        table = await self._async_read_table()
+        if not table.get(mac):
+            try:
+                subnet = subnet_of(subnet_address)
+            except ValueError:
+                # a host name, which DNS keeps up to date
+                subnet = None
+            if subnet is not None:
+                table = await self._async_sweep(subnet)
+        host = next((host for host in table.get(mac, []) if host != exclude), None)
+        if host is not None:
+            self._cache[mac] = (host, time.monotonic() + self._ttl)
+        return host
+
+    async def _async_read_table(self) -> dict:
+        """Return the neighbor table, sharing a read already in progress."""
+        if self._table is None:
+            self._table = self.hass.async_add_executor_job(read_arp_table)
+            self._table.add_done_callback(self._table_read)
+        return await asyncio.shield(self._table)
+
+    def _table_read(self, future):
+        """Let the next lookup read the table afresh."""
+        if self._table is future:
+            self._table = None
+
+    async def _async_sweep(self, subnet: str) -> dict:
+        """Sweep subnet, or join the sweep in progress; return the table read after it.
+
+        A subnet swept within the cooldown is not swept again, and its
+        TVs are left to the next lookup.
+        """
+        sweep = self._sweeps.get(subnet)
+        if sweep is None:
+            if time.monotonic() < self._next_sweep.get(subnet, 0.0):
+                return {}
+            sweep = self._sweeps[subnet] = self.hass.async_create_task(self._async_run_sweep(subnet))
+        return await asyncio.shield(sweep)
+
+    async def _async_run_sweep(self, subnet: str) -> dict:
+        """Sweep subnet, then read the neighbor table it filled."""
+        _LOGGER.debug("Sweeping %s for missing TVs", subnet)
+        try:
+            await async_sweep([str(host) for host in ipaddress.ip_network(subnet).hosts()])
+            return await self.hass.async_add_executor_job(read_arp_table)
+        finally:
+            del self._sweeps[subnet]
+            self._next_sweep[subnet] = time.monotonic() + self._cooldown
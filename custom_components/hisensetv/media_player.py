@@ -1,19 +1,14 @@
 """ Hisense Television Integration as media_player device. """
 from datetime import timedelta 
-from hisensetv import HisenseTv
 
 import logging
-import platform
-import socket
-import subprocess as sp
-import sys
-import time
-import wakeonlan
 import voluptuous as vol
 
-from homeassistant.core import ServiceCall
+from homeassistant.core import callback
 from homeassistant.components.media_player import PLATFORM_SCHEMA, MediaPlayerDevice
 from homeassistant.components.media_player.const import (
+    ATTR_INPUT_SOURCE,
+    ATTR_MEDIA_VOLUME_LEVEL,
     SUPPORT_NEXT_TRACK,
     SUPPORT_PAUSE,
     SUPPORT_PLAY,
@@ -29,24 +24,24 @@ import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.typing import HomeAssistantType
 
 from homeassistant.const import (
-    ATTR_COMMAND,
-    ATTR_ENTITY_ID,
     CONF_BROADCAST_ADDRESS,
     CONF_HOST,
     CONF_MAC,
     CONF_NAME,
+    CONF_PLATFORM,
     CONF_SCAN_INTERVAL,
-    STATE_OFF,
-    STATE_ON
 )
 
-from . import HisenseTvDevice
+from . import HisenseData, HisenseTvDevice
 from . import const
+from .services import async_register_services
 from .const import (
-    COMMANDS,
     CONF_MODEL,
+    CONF_OFF_AFTER_MISSES,
     CONF_PAUSE_RESUME,
+    CONF_PROBE_TIMEOUT,
     DEFAULT_MODEL,
+    DEFAULT_OFF_AFTER_MISSES,
     DEFAULT_NAME,
     DEFAULT_PAUSE_RESUME,
     DEFAULT_PING_TIMEOUT,
@@ -54,8 +49,6 @@ from .const import (
     DEFAULT_MIN_VOLUME,
     DOMAIN,
     DOMAIN_DATA,
-    SERVICE_SEND_COMMAND,
-    SERVICE_UPDATE_SOURCES,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -75,19 +68,6 @@ SUPPORT_HISENSE_TV = (
 )
 
 
-SCHEMA_SEND_COMMAND = vol.Schema(
-    {
-        vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
-        vol.Required(ATTR_COMMAND): vol.In(list(COMMANDS)),
-    }
-)
-
-SCHEMA_UPDATE_SOURCES = vol.Schema(
-    {
-        vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
-    }
-)
- 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Required(CONF_HOST): cv.string,
@@ -97,14 +77,24 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Optional(CONF_MODEL, default=DEFAULT_MODEL): cv.string,
         vol.Optional(CONF_PAUSE_RESUME, default=DEFAULT_PAUSE_RESUME): cv.string,
         vol.Optional(CONF_SCAN_INTERVAL, default=SCAN_INTERVAL): cv.time_period,
+        vol.Optional(CONF_PROBE_TIMEOUT, default=DEFAULT_PING_TIMEOUT): cv.positive_float,
+        vol.Optional(CONF_OFF_AFTER_MISSES, default=DEFAULT_OFF_AFTER_MISSES): vol.All(
+            vol.Coerce(int), vol.Range(min=1)
+        ),
     }
 )
 
 
-async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+async def async_setup_entry(hass, entry, async_add_entities):
+    """Set up the media_player of a TV added through the config flow."""
+    config = PLATFORM_SCHEMA({CONF_PLATFORM: DOMAIN, **entry.data})
+    return await async_setup_platform(hass, config, async_add_entities, unique_id=entry.unique_id)
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None, unique_id=None):
     """Set up the Hisense TV platform."""
     if DOMAIN_DATA not in hass.data:
-        hass.data[DOMAIN_DATA] = []
+        hass.data[DOMAIN_DATA] = HisenseData(hass)
 
     broadcast_address = config.get(CONF_BROADCAST_ADDRESS)
     host = config.get(CONF_HOST)
@@ -113,60 +103,28 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
     name = config.get(CONF_NAME)
     pause_resume = config.get(CONF_PAUSE_RESUME).lower()
     scan_interval = config.get(CONF_SCAN_INTERVAL).total_seconds()
+    probe_timeout = config.get(CONF_PROBE_TIMEOUT)
+    off_after_misses = config.get(CONF_OFF_AFTER_MISSES)
+
+    coordinator = hass.data[DOMAIN_DATA].get_coordinator(
+        hass, host, scan_interval, probe_timeout, off_after_misses, mac, broadcast_address
+    )
 
     async_add_entities(
         [
            HisenseTvMediaPlayer(
+                coordinator=coordinator,
                 name=name,
-                host=host,
                 mac=mac,
                 model=model,
                 broadcast_address=broadcast_address,
-                scan_interval=scan_interval,
                 pause_resume=pause_resume,
+                unique_id=unique_id,
            )
-        ],
-        update_before_add=True,
-    )
-
-    async def async_service_handler(service_call: ServiceCall):
-        """Handle for services."""
-        _LOGGER.debug("service_handle, service=%s", service_call.service)
-        if service_call.service == SERVICE_UPDATE_SOURCES:
-           entity_ids = service_call.data[ATTR_ENTITY_ID]
-           _LOGGER.debug("service_handle, entity(s)=%s", entity_ids)
-           for device in hass.data[DOMAIN_DATA].devices:
-              if device.entity_id in entity_ids:
-                 device.refresh_sources()
-                 device.async_schedule_update_ha_state(True)
-        elif service_call.service == SERVICE_SEND_COMMAND:
-           entity_ids = service_call.data[ATTR_ENTITY_ID]
-           command = service_call.data[ATTR_COMMAND]
-           _LOGGER.debug("service_handle, command=%s entity(s)=%s", command, entity_ids)
-           for device in hass.data[DOMAIN_DATA].devices:
-              if device.entity_id in entity_ids:
-                 device.send_command(command)
-                 device.async_schedule_update_ha_state(True)
-           if not entity_found:
-              _LOGGER.error("Invalid entity provided in service: %s entity: %s", service_call.service, entity_ids)
-        else:
-           """Service has not been defined"""
-           _LOGGER.error("Service definition not created, service=%s", service_call.service)
-
-
-    hass.services.async_register(
-        DOMAIN,
-        SERVICE_SEND_COMMAND,
-        async_service_handler,
-        schema=SCHEMA_SEND_COMMAND,
+        ]
     )
 
-    hass.services.async_register(
-        DOMAIN,
-        SERVICE_UPDATE_SOURCES,
-        async_service_handler,
-        schema=SCHEMA_UPDATE_SOURCES,
-    )
+    async_register_services(hass)
 
     _LOGGER.debug("setup_platform, SUCCESS, config=%s", config)
 
@@ -177,22 +135,15 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
 class HisenseTvMediaPlayer(HisenseTvDevice, MediaPlayerDevice):
     """Representation of a HiSense TV as Media Player."""
 
-    def __init__(self, host: str, mac: str, model: str, name: str, broadcast_address: str, scan_interval: int, pause_resume: str):
-        HisenseTvDevice.__init__(self, host, mac, model, name, broadcast_address, scan_interval)
-        self._volume = None
+    def __init__(
+        self, coordinator, mac: str, model: str, name: str, broadcast_address: str, pause_resume: str,
+        unique_id: str = None,
+    ):
+        HisenseTvDevice.__init__(self, coordinator, mac, model, name, broadcast_address, unique_id)
         self._min_volume = DEFAULT_MIN_VOLUME
         self._max_volume = DEFAULT_MAX_VOLUME
-        self._source = None
-        self._source_list = []
-        self._state = STATE_OFF
-        self._source_map_dict = {}
         self._pause_resume = pause_resume
 
-    @property
-    def state(self):
-        """Return the state of the device."""
-        return self._state
-
     @property
     def supported_features(self):
         """Flag media player features that are supported."""
@@ -201,225 +152,85 @@ class HisenseTvMediaPlayer(HisenseTvDevice, MediaPlayerDevice):
     @property
     def volume_level(self):
         """Volume level of the media player (0..1)."""
-        if self._volume is not None:
-            return self._volume
+        if self._coordinator.volume is not None:
+            return self._coordinator.volume / self._max_volume
         return None
 
     @property
     def source(self):
         """Return the current input source."""
-        return self._source
+        return self._coordinator.source
+
+    @property
+    def app_name(self):
+        """Return the app in front, if any."""
+        return self._coordinator.app
 
     @property
     def source_list(self):
         """List of available input sources."""
-        return self._source_list
-
-    def _refresh_sources(self):
+        return self._coordinator.source_list
+
+    @callback
+    def _async_restore(self, last_state):
+        """Seed the coordinator from the last recorded state, attributes included."""
+        volume_level = last_state.attributes.get(ATTR_MEDIA_VOLUME_LEVEL)
+        self._coordinator.async_restore(
+            state=last_state.state,
+            volume=None if volume_level is None else int(volume_level * self._max_volume),
+            source=last_state.attributes.get(ATTR_INPUT_SOURCE),
+        )
+
+    async def async_refresh_sources(self) -> bool:
         """Refresh source list"""
-        _LOGGER.debug("_refresh_sources - starting...")
-        try:
-            with HisenseTv(self._host) as tv:
-               source_list = tv.get_sources()
-            if source_list is not None:
-               self._source_list = []
-               self._source_dict_map = {}
-               for source in source_list: 
-                  id =  source.get("sourceid")
-                  # Displayname and sourename appear to always be the same for me
-                  #name =  source.get("displayname")
-                  name =  source.get("sourcename")
-                  self._source_map_dict[name] = id
-                  self._source_list.append(name)
-                  #_LOGGER.debug("_refresh_sources - Name='%s'", name)
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def _refresh_volume(self):
-        """Refresh volume information."""
-        #_LOGGER.debug("_refresh_volume - starting...")
-        try:
-           with HisenseTv(self._host) as tv:
-              volume_info = tv.get_volume()
-           if volume_info is not None:
-              volume_value =  volume_info.get("volume_value") 
-              self._volume = (volume_value / self._max_volume)
-              _LOGGER.debug("_refresh_volume - Volume='%s'", volume_value)
-        except socket.error as e:
-           if "host is unreachable" in str(e).lower():
-              _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-           else:
-              _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-              raise
-
-    def refresh_sources(self):
-        """Refresh source list"""
-        self._refresh_sources()
+        return await self._coordinator.async_refresh_sources()
 
-    def select_source(self, source):
+    async def async_select_source(self, source) -> bool:
         """Select input source."""
-        try:
-            source_int = self._source_map_dict.get(source)
-            _LOGGER.debug("select_source - SourceInt='%s'", source_int)
-            with HisenseTv(self._host) as tv:
-               tv.set_source(source_int,source)
-            self._source = source
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def set_volume_level(self, volume: float):
+        return await self._coordinator.async_select_source(source)
+
+    async def async_set_volume_level(self, volume: float):
         """Set volume"""
-        try:
-            with HisenseTv(self._host) as tv:
-               volume_int = int( volume * self._max_volume )
-               tv.set_volume(volume_int)
-               _LOGGER.debug("set_volume_level - Volume='%4.3f'", volume)
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def volume_up(self):
+        await self._coordinator.async_set_volume(int( volume * self._max_volume ))
+        _LOGGER.debug("set_volume_level - Volume='%4.3f'", volume)
+
+    async def async_volume_up(self):
         """Increase volume by one."""
-        try:
-            if self._volume is None:
-                  self._volume = 0
-            else:
-               if ((self._volume * self._max_volume) + 1) >= self._max_volume :
-                  self._volume = 1
-               else:
-                  self._volume = self._volume  + (1 / self._max_volume) 
-            with HisenseTv(self._host) as tv:
-               tv.set_volume( int(self._volume * self._max_volume) )
-            _LOGGER.debug("volume_up - Volume='%.3f'", self._volume)
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def volume_down(self):
+        volume = self._coordinator.volume
+        if volume is None:
+           volume = self._min_volume
+        else:
+           volume = min(volume + 1, self._max_volume)
+        await self._coordinator.async_set_volume(volume)
+        _LOGGER.debug("volume_up - Volume='%d'", volume)
+
+    async def async_volume_down(self):
         """Decrease volume by one."""
-        try:
-            if self._volume is None:
-                  self._volume = 0
-            else:
-               if ((self._volume * self._max_volume) - 1) <= self._min_volume :
-                  self._volume = 0 
-               else:
-                  self._volume = self._volume  - (1 / self._max_volume)                  
-            with HisenseTv(self._host) as tv:
-               tv.set_volume( int(self._volume * self._max_volume) )
-            _LOGGER.debug("volume_down - Volume='%.3f'", self._volume)
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def media_play(self):
+        volume = self._coordinator.volume
+        if volume is None:
+           volume = self._min_volume
+        else:
+           volume = max(volume - 1, self._min_volume)
+        await self._coordinator.async_set_volume(volume)
+        _LOGGER.debug("volume_down - Volume='%d'", volume)
+
+    async def async_media_play(self):
         """Play."""
-        try:
-            with HisenseTv(self._host) as tv:
-               if self._pause_resume == 'ok':
-                  tv.send_key_ok()
-               elif self._pause_resume == 'pause':
-                  tv.send_key_pause()
-               else:
-                  tv.send_key_play()
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def media_pause(self):
+        if self._pause_resume == 'ok':
+           await self._async_call_tv(lambda tv: tv.send_key_ok())
+        elif self._pause_resume == 'pause':
+           await self._async_call_tv(lambda tv: tv.send_key_pause())
+        else:
+           await self._async_call_tv(lambda tv: tv.send_key_play())
+
+    async def async_media_pause(self):
         """Pause."""
-        try:
-            with HisenseTv(self._host) as tv:
-               tv.send_key_pause()
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def media_next_track(self):
+        await self._async_call_tv(lambda tv: tv.send_key_pause())
+
+    async def async_media_next_track(self):
         """Send next track command."""
-        try:
-            with HisenseTv(self._host) as tv:
-               tv.send_key_forwards()
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def media_previous_track(self):
-        """Send previous track command."""
-        try:
-            with HisenseTv(self._host) as tv:
-               tv.send_key_backs()
-        except socket.error as e:
-            if "host is unreachable" in str(e).lower():
-               _LOGGER.error("Unable to reach HisenseTV, likely powered off already")
-            else:
-               _LOGGER.error("Unexpected error: %s", sys.exc_info()[0])
-               raise
-
-    def _update(self):
-        """ Retrieve the latest data without interval enforcing."""
-        _LOGGER.debug("_update - starting...")
-        try:
-           """Check if device is on and update the state."""
-           if platform.system().lower() == "windows":
-               ping_cmd = [
-                   "ping",
-                   "-n",
-                   "1",
-                   "-w",
-                   str(DEFAULT_PING_TIMEOUT * 1000),
-                   str(self._host),
-               ]
-           else:
-               ping_cmd = [
-                   "ping",
-                   "-c",
-                   "1",
-                   "-W",
-                   str(DEFAULT_PING_TIMEOUT),
-                   str(self._host),
-               ]
-
-           status = sp.call(ping_cmd, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-           if bool(status):
-              self._state = STATE_OFF
-           else:
-              self._state = STATE_ON
-
-              # refresh volume
-              self._refresh_volume()
-
-              # refresh source list, if empty list (not init yet)
-              if not self._source_list:
-                 self._refresh_sources()
-
-        except Exception as exception_instance:
-            _LOGGER.error(exception_instance)
-            self._state = STATE_OFF
+        await self._async_call_tv(lambda tv: tv.send_key_fast_forward())
 
+    async def async_media_previous_track(self):
+        """Send previous track command."""
+        await self._async_call_tv(lambda tv: tv.send_key_rewind())
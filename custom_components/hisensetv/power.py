@@ -0,0 +1,59 @@
+""" Hisense Television power state estimation. """
+import time
+
+from .const import DEFAULT_OFF_AFTER_MISSES, POWER_PUSH_FRESH_SEC
+
+
+class PowerEstimator:
+    """Decides whether a TV is on from every signal it gives.
+
+    The TV counts as up while its MQTT port answers a probe, a session to
+    it carried traffic recently, or it pushed a broadcast within
+    POWER_PUSH_FRESH_SEC.
+    It is only declared off after off_after_misses polls in a row without
+    any of these, so a single lost probe does not flip it. A TV that is
+    up but reports sleep, as it does when turned off with the remote, is
+    off at once; it stays off until it reports another state or stops
+    answering altogether.
+    """
+
+    def __init__(self, off_after_misses: int = DEFAULT_OFF_AFTER_MISSES):
+        self.off_after_misses = off_after_misses
+        self.misses = 0
+        self.asleep = False
+        self._last_push = None
+
+    def push(self):
+        """Note a broadcast from the TV."""
+        self._last_push = time.monotonic()
+
+    def report_state(self, is_on: bool):
+        """Note the power state the TV reported itself."""
+        self.asleep = not is_on
+
+    @property
+    def pushed_recently(self) -> bool:
+        """Return true if the TV pushed a broadcast within POWER_PUSH_FRESH_SEC."""
+        return self._last_push is not None and time.monotonic() - self._last_push < POWER_PUSH_FRESH_SEC
+
+    @property
+    def undecided(self) -> bool:
+        """Return true while misses are counted toward declaring the TV off."""
+        return 0 < self.misses < self.off_after_misses
+
+    def estimate(self, reachable: bool, session_alive: bool):
+        """Return true if the TV is on, false if off, or None if undecided.
+
+        reachable is the outcome of this poll's probe and queries;
+        session_alive is true if an open session heard from the TV lately,
+        not merely if paho still considers it connected.
+        """
+        if reachable or session_alive or self.pushed_recently:
+            self.misses = 0
+            return not self.asleep
+        self.misses += 1
+        if self.misses < self.off_after_misses:
+            return None
+        # fully off; whatever it reports next is a fresh start
+        self.asleep = False
+        return False
@@ -0,0 +1,25 @@
+""" Hisense Television power probe. """
+import asyncio
+import logging
+
+from .const import (
+    DEFAULT_MQTT_PORT,
+    DEFAULT_PING_TIMEOUT,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_probe(host: str, port: int = DEFAULT_MQTT_PORT, timeout: float = DEFAULT_PING_TIMEOUT) -> bool:
+    """Return true if the TV accepts TCP connections on its MQTT port.
+
+    The broker only listens while the TV is powered on, so a successful
+    connect is used as the power state.
+    """
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        _LOGGER.debug("Probe of %s:%d failed: %r", host, port, e)
+        return False
+    writer.close()
+    return True
@@ -0,0 +1,62 @@
+""" Hisense Television adaptive poll scheduling. """
+import random
+import time
+import zlib
+
+from .const import (
+    POLL_FAST_INTERVAL_SEC,
+    POLL_FAST_WINDOW_SEC,
+    POLL_JITTER,
+    POLL_OFF_BACKOFF_FACTOR,
+    POLL_OFF_MAX_INTERVAL_SEC,
+    POLL_STARTUP_SPREAD_SEC,
+)
+
+
+class AdaptivePollScheduler:
+    """Decides when a TV is polled next.
+
+    A TV that is on is polled every scan interval. While it stays off the
+    interval grows geometrically up to POLL_OFF_MAX_INTERVAL_SEC. After a
+    state change or a command it is polled every POLL_FAST_INTERVAL_SEC
+    for POLL_FAST_WINDOW_SEC. Each host gets a stable phase offset plus a
+    small random jitter so many TVs do not poll in lockstep.
+    """
+
+    def __init__(self, host: str, scan_interval: float):
+        self.scan_interval = scan_interval
+        # stable per-host value in [0, 1) used to spread the first polls
+        self._phase = zlib.crc32(host.encode()) / 2 ** 32
+        self._off_polls = 0
+        self._fast_until = 0.0
+
+    def initial_delay(self) -> float:
+        """Delay before the first poll, spread across the first few seconds."""
+        return self._phase * min(self.scan_interval, POLL_STARTUP_SPREAD_SEC)
+
+    def activity(self):
+        """Start a window of fast polling after a state change or command."""
+        self._fast_until = time.monotonic() + POLL_FAST_WINDOW_SEC
+
+    @property
+    def fast(self) -> bool:
+        """Return true while in the fast polling window."""
+        return time.monotonic() < self._fast_until
+
+    def next_interval(self, is_on: bool) -> float:
+        """Return the delay until the next poll, given the current state."""
+        if is_on:
+            self._off_polls = 0
+        else:
+            self._off_polls += 1
+
+        if self.fast:
+            return min(POLL_FAST_INTERVAL_SEC, self.scan_interval)
+        if is_on:
+            interval = self.scan_interval
+        else:
+            interval = min(
+                self.scan_interval * POLL_OFF_BACKOFF_FACTOR ** (self._off_polls - 1),
+                max(self.scan_interval, POLL_OFF_MAX_INTERVAL_SEC),
+            )
+        return interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
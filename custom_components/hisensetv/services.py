@@ -0,0 +1,259 @@
+""" Hisense Television services. """
+from homeassistant.components.group import expand_entity_ids
+from homeassistant.core import ServiceCall, callback
+import homeassistant.helpers.config_validation as cv
+
+import asyncio
+import logging
+import time
+import voluptuous as vol
+
+from homeassistant.const import ATTR_COMMAND, ATTR_ENTITY_ID, ENTITY_MATCH_ALL, STATE_ON
+
+from .breaker import HisenseTvUnavailableError, tv_errors
+from .const import (
+    ATTR_COMMANDS,
+    ATTR_DELAY,
+    ATTR_MAX_PARALLEL,
+    ATTR_POWER,
+    ATTR_REPEAT,
+    ATTR_SOURCE,
+    ATTR_TIMEOUT,
+    ATTR_VOLUME,
+    BROADCAST_TIMEOUT_SEC,
+    COMMANDS,
+    DOMAIN,
+    DOMAIN_DATA,
+    EVENT_BROADCAST_RESULT,
+    EVENT_SERVICE_RESULT,
+    MAX_COMMAND_REPEAT,
+    SERVICE_BROADCAST,
+    SERVICE_MAX_PARALLEL,
+    SERVICE_SEND_COMMAND,
+    SERVICE_SEND_COMMANDS,
+    SERVICE_UPDATE_SOURCES,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+SCHEMA_COMMAND_STEP = vol.Any(
+    vol.All(
+        vol.In(list(COMMANDS)),
+        lambda command: {ATTR_COMMAND: command, ATTR_DELAY: 0, ATTR_REPEAT: 1},
+    ),
+    vol.Schema(
+        {
+            vol.Required(ATTR_COMMAND): vol.In(list(COMMANDS)),
+            vol.Optional(ATTR_DELAY, default=0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            vol.Optional(ATTR_REPEAT, default=1): vol.All(
+                vol.Coerce(int), vol.Range(min=1, max=MAX_COMMAND_REPEAT)
+            ),
+        }
+    ),
+)
+
+SCHEMA_SEND_COMMAND = vol.Schema(
+    {
+        vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+        vol.Required(ATTR_COMMAND): vol.In(list(COMMANDS)),
+    }
+)
+
+SCHEMA_SEND_COMMANDS = vol.Schema(
+    {
+        vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+        vol.Required(ATTR_COMMANDS): vol.All(cv.ensure_list, [SCHEMA_COMMAND_STEP]),
+    }
+)
+
+SCHEMA_UPDATE_SOURCES = vol.Schema(
+    {
+        vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+    }
+)
+
+
+def _power_off_alone(data: dict) -> dict:
+    """Reject turning TVs off combined with actions only a TV that is on can take."""
+    if data.get(ATTR_POWER) is False:
+        combined = [key for key in (ATTR_SOURCE, ATTR_VOLUME, ATTR_COMMAND) if key in data]
+        if combined:
+            raise vol.Invalid(f"{ATTR_POWER}: false cannot be combined with {', '.join(combined)}")
+    return data
+
+
+SCHEMA_BROADCAST = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(ATTR_ENTITY_ID, default=ENTITY_MATCH_ALL): cv.comp_entity_ids,
+            vol.Optional(ATTR_POWER): cv.boolean,
+            vol.Optional(ATTR_SOURCE): cv.string,
+            vol.Optional(ATTR_VOLUME): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+            vol.Optional(ATTR_COMMAND): vol.In(list(COMMANDS)),
+            vol.Optional(ATTR_TIMEOUT, default=BROADCAST_TIMEOUT_SEC): vol.All(
+                vol.Coerce(float), vol.Range(min=0, min_included=False)
+            ),
+            vol.Optional(ATTR_MAX_PARALLEL, default=SERVICE_MAX_PARALLEL): vol.All(
+                vol.Coerce(int), vol.Range(min=1)
+            ),
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_POWER, ATTR_SOURCE, ATTR_VOLUME, ATTR_COMMAND),
+    _power_off_alone,
+)
+
+
+async def async_fan_out(targets: dict, action, max_parallel: int = SERVICE_MAX_PARALLEL, timeout: float = None) -> dict:
+    """Run action(device) for every target, at most max_parallel at a time.
+
+    targets maps a name to its device, or to None if it is unknown. action
+    returns true on success and is given timeout seconds per target.
+    Returns a result per target name, with an error message on failure.
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def run(name, device):
+        if device is None:
+            _LOGGER.error("Invalid entity provided in service: %s", name)
+            return {"success": False, "error": "unknown entity"}
+        async with semaphore:
+            try:
+                if await asyncio.wait_for(action(device), timeout):
+                    return {"success": True}
+                return {"success": False, "error": "not sent"}
+            except asyncio.TimeoutError:
+                _LOGGER.error("Service call to %s timed out after %ss", name, timeout)
+                return {"success": False, "error": "timeout"}
+            except tv_errors() + (ValueError,) as e:
+                _LOGGER.error("Service call to %s failed: %s", name, e)
+                return {"success": False, "error": str(e)}
+
+    results = await asyncio.gather(*(run(name, device) for name, device in targets.items()))
+    return dict(zip(targets, results))
+
+
+async def _async_send_commands(device, steps: list) -> bool:
+    """Send a command sequence; true if every press was sent."""
+    results = await device.async_send_commands(steps)
+    return all(result["success"] for result in results)
+
+
+async def _async_refresh_sources(device) -> bool:
+    """Refresh the source list of a media_player."""
+    if not hasattr(device, "async_refresh_sources"):
+        raise ValueError(f"{device.entity_id} has no source list")
+    return await device.async_refresh_sources()
+
+
+async def _async_broadcast(device, data: dict) -> bool:
+    """Apply power, then source, volume and key to the TV of device."""
+    coordinator = device.coordinator
+    power = data.get(ATTR_POWER)
+    if power is False:
+        # the power key toggles, so a TV that is off is left alone
+        return coordinator.state != STATE_ON or await device.async_turn_off()
+    if power and coordinator.state != STATE_ON:
+        await device.async_turn_on()
+        if coordinator.state != STATE_ON:
+            raise HisenseTvUnavailableError(f"{coordinator.host} did not wake")
+    if ATTR_SOURCE in data and not await coordinator.async_select_source(data[ATTR_SOURCE]):
+        return False
+    if ATTR_VOLUME in data and not await coordinator.async_write_volume(data[ATTR_VOLUME]):
+        return False
+    if ATTR_COMMAND in data:
+        return await device.async_send_command(data[ATTR_COMMAND])
+    return True
+
+
+def _broadcast_targets(hass, entity_ids) -> dict:
+    """Map the host of every targeted TV to one of its devices.
+
+    Groups are expanded. A TV with both a media_player and a switch is
+    targeted once, since the power key toggles.
+    """
+    devices = hass.data[DOMAIN_DATA].devices
+    if entity_ids == ENTITY_MATCH_ALL:
+        entity_ids = list(devices)
+    else:
+        entity_ids = expand_entity_ids(hass, entity_ids)
+    targets = {}
+    for entity_id in entity_ids:
+        device = devices.get(entity_id)
+        if device is None:
+            targets[entity_id] = None
+        else:
+            targets.setdefault(device.coordinator.host, device)
+    return targets
+
+
+@callback
+def async_register_services(hass):
+    """Register the hisensetv services, once for all platforms."""
+    if hass.services.has_service(DOMAIN, SERVICE_SEND_COMMAND):
+        return
+
+    async def async_service_handler(service_call: ServiceCall):
+        """Handle for services."""
+        entity_ids = service_call.data[ATTR_ENTITY_ID]
+        _LOGGER.debug("service_handle, service=%s entity(s)=%s", service_call.service, entity_ids)
+        if service_call.service == SERVICE_SEND_COMMAND:
+            command = service_call.data[ATTR_COMMAND]
+            action = lambda device: device.async_send_command(command)
+        elif service_call.service == SERVICE_SEND_COMMANDS:
+            steps = service_call.data[ATTR_COMMANDS]
+            action = lambda device: _async_send_commands(device, steps)
+        elif service_call.service == SERVICE_UPDATE_SOURCES:
+            action = _async_refresh_sources
+        else:
+            _LOGGER.error("Service definition not created, service=%s", service_call.service)
+            return
+
+        devices = hass.data[DOMAIN_DATA].devices
+        start = time.monotonic()
+        results = await async_fan_out({entity_id: devices.get(entity_id) for entity_id in entity_ids}, action)
+        hass.bus.async_fire(
+            EVENT_SERVICE_RESULT,
+            {
+                "service": service_call.service,
+                "results": results,
+                "elapsed": round(time.monotonic() - start, 3),
+            },
+        )
+
+    async def async_broadcast_handler(service_call: ServiceCall):
+        """Apply one action to a group of TVs and report a summary."""
+        data = service_call.data
+        targets = _broadcast_targets(hass, data[ATTR_ENTITY_ID])
+        _LOGGER.debug("broadcast, TV(s)=%s", list(targets))
+        start = time.monotonic()
+        results = await async_fan_out(
+            targets, lambda device: _async_broadcast(device, data), data[ATTR_MAX_PARALLEL], data[ATTR_TIMEOUT]
+        )
+        elapsed = round(time.monotonic() - start, 3)
+        succeeded = sum(1 for result in results.values() if result["success"])
+        _LOGGER.info(
+            "broadcast to %d TV(s): %d succeeded, %d failed in %.1fs",
+            len(results), succeeded, len(results) - succeeded, elapsed,
+        )
+        hass.bus.async_fire(
+            EVENT_BROADCAST_RESULT,
+            {
+                "results": results,
+                "succeeded": succeeded,
+                "failed": len(results) - succeeded,
+                "elapsed": elapsed,
+            },
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SEND_COMMAND, async_service_handler, schema=SCHEMA_SEND_COMMAND
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_SEND_COMMANDS, async_service_handler, schema=SCHEMA_SEND_COMMANDS
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_UPDATE_SOURCES, async_service_handler, schema=SCHEMA_UPDATE_SOURCES
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_BROADCAST, async_broadcast_handler, schema=SCHEMA_BROADCAST
+    )
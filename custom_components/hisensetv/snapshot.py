@@ -0,0 +1,44 @@
+""" Hisense Television state snapshots. """
+from typing import NamedTuple, Optional
+
+from homeassistant.const import STATE_OFF, STATE_ON
+
+from .const import (
+    LIVETV_SOURCE,
+    STATETYPE_APP,
+    STATETYPE_LIVETV,
+    STATETYPE_SLEEP,
+    STATETYPE_SOURCE,
+)
+
+
+class HisenseTvSnapshot(NamedTuple):
+    """Power, volume, input and app of a TV at one point in time."""
+
+    state: str
+    volume: Optional[int] = None
+    source: Optional[str] = None
+    app: Optional[str] = None
+
+
+def parse_tv_state(payload, source_list: list) -> dict:
+    """Return the snapshot fields a TV state message settles.
+
+    The same message is answered to a gettvstate request and broadcast on
+    every change. Fields it says nothing about are left out, so the source
+    is kept while an app is in front.
+    """
+    if not isinstance(payload, dict):
+        return {}
+    statetype = payload.get("statetype")
+    if statetype == STATETYPE_SLEEP:
+        return {"state": STATE_OFF}
+    if statetype == STATETYPE_SOURCE:
+        return {"state": STATE_ON, "source": payload.get("sourcename"), "app": None}
+    if statetype == STATETYPE_LIVETV:
+        if LIVETV_SOURCE in source_list:
+            return {"state": STATE_ON, "source": LIVETV_SOURCE, "app": None}
+        return {"state": STATE_ON, "app": None}
+    if statetype == STATETYPE_APP:
+        return {"state": STATE_ON, "app": payload.get("name")}
+    return {"state": STATE_ON}
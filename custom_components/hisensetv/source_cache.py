@@ -0,0 +1,39 @@
+""" Hisense Television source list cache. """
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+import logging
+
+from .const import (
+    SOURCE_CACHE_SAVE_DELAY_SEC,
+    STORAGE_KEY,
+    STORAGE_VERSION,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class HisenseTvSourceCache:
+    """Source lists and last selected source of every TV, kept across restarts."""
+
+    def __init__(self, hass):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._data = {}
+
+    async def async_load(self):
+        """Load the cache from storage."""
+        self._data = await self._store.async_load() or {}
+        _LOGGER.debug("Loaded cached sources for %d TV(s)", len(self._data))
+
+    def get(self, host: str) -> dict:
+        """Return the cached entry for host, or an empty dict."""
+        return self._data.get(host, {})
+
+    @callback
+    def async_set(self, host: str, source_map: dict, source: str, updated: float):
+        """Update the entry for host and schedule a save."""
+        entry = {"sources": source_map, "source": source, "updated": updated}
+        if self._data.get(host) == entry:
+            return
+        self._data[host] = entry
+        self._store.async_delay_save(lambda: self._data, SOURCE_CACHE_SAVE_DELAY_SEC)
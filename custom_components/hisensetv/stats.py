@@ -0,0 +1,117 @@
+""" Hisense Television per-host latency and error statistics. """
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import threading
+import time
+
+from .const import STATS_BUCKETS_MS
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, so memory stays bounded however long it runs."""
+
+    def __init__(self, buckets=STATS_BUCKETS_MS):
+        self._bounds = list(buckets)
+        # the last bucket catches everything above the highest bound
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.min = None
+        self.max = 0.0
+
+    def add(self, value_ms: float):
+        """Count one sample."""
+        self._counts[bisect_left(self._bounds, value_ms)] += 1
+        self.count += 1
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, percent: float):
+        """Estimate a percentile, interpolating within its bucket.
+
+        Bucket edges are narrowed to the smallest and largest sample seen.
+        """
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self._counts):
+            if count and seen + count >= rank:
+                low = max(self._bounds[index - 1] if index else 0.0, self.min)
+                high = min(self._bounds[index] if index < len(self._bounds) else self.max, self.max)
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+class HisenseTvStats:
+    """Timings and failure counts of every operation on one TV.
+
+    Operations run in executor and MQTT threads, so updates are locked.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.reconnects = 0
+        self.last_probe_ms = None
+        self.tls_resumed = 0
+        self.tls_full_handshakes = 0
+        self._histograms = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, duration: float, success: bool = True):
+        """Record one run of operation taking duration seconds."""
+        with self._lock:
+            histogram = self._histograms.get(operation)
+            if histogram is None:
+                histogram = self._histograms[operation] = LatencyHistogram()
+                self._failures[operation] = 0
+            histogram.add(duration * 1000)
+            if not success:
+                self._failures[operation] += 1
+
+    @contextmanager
+    def measure(self, operation: str):
+        """Time the enclosed block as operation, counting exceptions as failures."""
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException:
+            self.record(operation, time.monotonic() - start, False)
+            raise
+        self.record(operation, time.monotonic() - start)
+
+    def record_probe(self, duration: float, success: bool):
+        """Record a power probe; a refused probe is a TV that is off."""
+        self.last_probe_ms = round(duration * 1000, 1)
+        self.record("probe", duration, success)
+
+    def record_reconnect(self):
+        """Count a session opened after an earlier one was lost or closed."""
+        with self._lock:
+            self.reconnects += 1
+
+    def record_tls(self, resumed: bool):
+        """Count a TLS handshake, resumed from an earlier session or not."""
+        with self._lock:
+            if resumed:
+                self.tls_resumed += 1
+            else:
+                self.tls_full_handshakes += 1
+
+    def as_dict(self) -> dict:
+        """Return flat p50/p95 latency and failure attributes per operation."""
+        attributes = {
+            "reconnects": self.reconnects,
+            "last_probe_ms": self.last_probe_ms,
+            "tls_resumed": self.tls_resumed,
+            "tls_full_handshakes": self.tls_full_handshakes,
+        }
+        with self._lock:
+            for operation, histogram in sorted(self._histograms.items()):
+                attributes[f"{operation}_count"] = histogram.count
+                attributes[f"{operation}_failures"] = self._failures[operation]
+                attributes[f"{operation}_p50_ms"] = round(histogram.percentile(50), 1)
+                attributes[f"{operation}_p95_ms"] = round(histogram.percentile(95), 1)
+        return attributes
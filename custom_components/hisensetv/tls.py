@@ -0,0 +1,65 @@
+""" Hisense Television TLS contexts with session resumption. """
+import logging
+import ssl
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+_context = None
+_context_lock = threading.Lock()
+
+
+class _ResumingSSLSocket(ssl.SSLSocket):
+    """SSL socket that hands its session back to the context after a handshake."""
+
+    def do_handshake(self, *args, **kwargs):
+        super().do_handshake(*args, **kwargs)
+        self.context.save_session(self)
+
+
+class HisenseTvSSLContext(ssl.SSLContext):
+    """Client context that resumes the last TLS session of each host.
+
+    A resumed session skips the key exchange, the slow part of a connect
+    for the TV's CPU. Sessions are kept by host name.
+    """
+
+    sslsocket_class = _ResumingSSLSocket
+
+    def __new__(cls, *args, **kwargs):
+        context = super().__new__(cls, *args, **kwargs)
+        context._sessions = {}
+        context._sessions_lock = threading.Lock()
+        return context
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None and server_hostname is not None:
+            with self._sessions_lock:
+                session = self._sessions.get(server_hostname)
+        return super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+
+    def save_session(self, sock: ssl.SSLSocket):
+        """Keep the session of sock for the next connection to its host.
+
+        With TLS 1.3 the resumable session arrives after the handshake, so
+        this is called again before the socket is closed.
+        """
+        session = sock.session
+        if session is not None and sock.server_hostname is not None:
+            with self._sessions_lock:
+                self._sessions[sock.server_hostname] = session
+
+
+def shared_context() -> HisenseTvSSLContext:
+    """Return the context shared by every TV connection, creating it once.
+
+    Like hisensetv, the TV's self-signed certificate is not verified.
+    """
+    global _context
+    with _context_lock:
+        if _context is None:
+            context = HisenseTvSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            _context = context
+        return _context